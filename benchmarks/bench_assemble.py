@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""Benchmark partition and node state assembly.
+
+Times the slurmd node state overrides (SlurmdCharm._assemble_slurmd_info)
+and the configurator default partition and hostlist stages
+(SlurmConfiguratorCharm._assemble_partitions) at increasing node counts,
+next to the deepcopy/remove/append implementation they replaced. The
+legacy stages work on the inventory dicts, the current ones on the
+NodeRecord and PartitionRecord the dicts are read into.
+
+Usage: python3 benchmarks/bench_assemble.py [node_count ...]
+"""
+import copy
+import sys
+
+from common import load_charm_module, make_inventory, timeit
+
+
+slurmd_utils = load_charm_module('charm-slurmd', 'utils')
+configurator_utils = load_charm_module('charm-slurm-configurator', 'utils')
+inventory = load_charm_module('charm-slurm-configurator', 'inventory')
+
+
+def legacy_apply_node_states(inventory, node_states):
+    """Apply node_states the way _assemble_slurmd_info used to."""
+    inventory_tmp = copy.deepcopy(inventory)
+    for node in inventory:
+        if node['node_name'] in node_states.keys():
+            node_tmp = copy.deepcopy(node)
+            node_tmp['state'] = node_states[node['node_name']]
+            inventory_tmp.remove(node)
+            inventory_tmp.append(node_tmp)
+    return inventory_tmp
+
+
+def legacy_set_default_partition(partitions, partition_name):
+    """Flag the default partition the way _assemble_partitions used to."""
+    partitions_tmp = copy.deepcopy(partitions)
+    for partition in partitions:
+        partition_tmp = copy.deepcopy(partition)
+        if partition['partition_name'] == partition_name:
+            partition_tmp['partition_default'] = 'YES'
+            partitions_tmp.remove(partition)
+            partitions_tmp.append(partition_tmp)
+    return partitions_tmp
+
+
+def group_partitions(partitions):
+    """Run the configurator hostlist stage."""
+    return [
+        partition.replace(
+            inventory=configurator_utils.group_nodes(partition.inventory)
+        )
+        for partition in partitions
+    ]
+
+
+def main(node_counts):
+    """Print the timings for each node count."""
+    print(f"{'nodes':>8} {'stage':<28} {'legacy (s)':>12} {'new (s)':>12}")
+    for node_count in node_counts:
+        nodes = make_inventory(node_count)
+        node_records = [inventory.NodeRecord.from_dict(node) for node in nodes]
+        # Drain one node in ten.
+        node_states = {
+            node['node_name']: "DRAIN" for node in nodes[::10]
+        }
+        legacy = timeit(legacy_apply_node_states, nodes, node_states)
+        new = timeit(
+            slurmd_utils.apply_node_states,
+            node_records,
+            node_states,
+        )
+        print(f"{node_count:>8} {'slurmd node states':<28} "
+              f"{legacy:>12.4f} {new:>12.4f}")
+
+        # Ten partitions sharing the nodes.
+        partitions = [
+            {
+                'partition_name': f"partition{i}",
+                'partition_state': "UP",
+                'partition_config': "",
+                'inventory': make_inventory(
+                    node_count // 10, f"p{i}-node", i
+                ),
+            }
+            for i in range(10)
+        ]
+        partition_records = [
+            inventory.PartitionRecord.from_dict(partition)
+            for partition in partitions
+        ]
+        legacy = timeit(legacy_set_default_partition, partitions, "partition0")
+        new = timeit(
+            configurator_utils.set_default_partition,
+            partition_records,
+            "partition0",
+        )
+        print(f"{node_count:>8} {'configurator default flag':<28} "
+              f"{legacy:>12.4f} {new:>12.4f}")
+
+        new = timeit(group_partitions, partition_records)
+        print(f"{node_count:>8} {'configurator hostlist':<28} "
+              f"{'-':>12} {new:>12.4f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000])
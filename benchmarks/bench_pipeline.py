@@ -0,0 +1,339 @@
+#!/usr/bin/python3
+"""Benchmark the slurmd -> slurm-configurator -> slurmctld config pipeline.
+
+Drives SlurmdCharm, SlurmConfiguratorCharm and SlurmctldCharm through
+ops.testing.Harness with a synthetic topology of slurmd applications and
+units carrying canned inventories. Harness can not relate two charms to
+each other, so the app data each stage publishes is relayed by hand into
+the next stage as relation-changed hooks.
+
+Every simulated hook is followed by a framework commit, as ops.main does at
+the end of a dispatch, so the deferred and coalesced work is included. For
+each stage the hook count, the wall time per hook and the relation data
+bytes written are reported. The 'change' stage replays a single hardware
+change of one node through the whole pipeline once the cluster has settled,
+the 'config' stage a config-changed of the configurator that leaves the
+slurmd_info untouched.
+
+slurm_ops_manager, nrpe_external_master and influxdb are replaced by the
+stand-ins in benchmarks/fakes, the benchmark runs offline and never touches
+the system.
+
+Usage: python3 benchmarks/bench_pipeline.py [--json FILE] [APPSxUNITS ...]
+"""
+import argparse
+import json
+import time
+
+from common import load_charm_class, load_charm_module, make_inventory
+from ops.testing import Harness
+
+
+SlurmdCharm = load_charm_class('charm-slurmd', 'SlurmdCharm')
+SlurmConfiguratorCharm = load_charm_class(
+    'charm-slurm-configurator',
+    'SlurmConfiguratorCharm',
+)
+SlurmctldCharm = load_charm_class('charm-slurmctld', 'SlurmctldCharm')
+SLURMCTLD_PAYLOAD_FEATURES = load_charm_module(
+    'charm-slurmctld',
+    'interface_slurmctld',
+).PAYLOAD_FEATURES
+
+
+SLURMCTLD_INFO = {
+    'active_controller_hostname': "slurmctld-0",
+    'active_controller_ingress_address': "10.255.0.1",
+    'active_controller_port': "6817",
+    'backup_controller_hostname': "",
+    'backup_controller_ingress_address': "",
+    'backup_controller_port': "",
+}
+SLURMDBD_INFO = {
+    'active_slurmdbd_hostname': "slurmdbd-0",
+    'active_slurmdbd_ingress_address': "10.255.0.2",
+    'active_slurmdbd_port': "6819",
+}
+
+
+class HookRecorder:
+    """Time the hooks run on a Harness and the relation bytes they write."""
+
+    def __init__(self):
+        """Start with no hooks recorded."""
+        self.times = []
+        self.writes = []
+
+    def run(self, harness, func, *args):
+        """Run func as one hook on harness and return its result."""
+        before = self._snapshot(harness)
+        start = time.perf_counter()
+        result = func(*args)
+        harness.framework.commit()
+        self.times.append(time.perf_counter() - start)
+
+        after = self._snapshot(harness)
+        written = sum(
+            len(key) + len(value)
+            for (relation_id, name), data in after.items()
+            for key, value in data.items()
+            if before.get((relation_id, name), {}).get(key) != value
+        )
+        if written:
+            self.writes.append(written)
+        return result
+
+    @staticmethod
+    def _snapshot(harness):
+        """Return a copy of the relation data harness's charm can write."""
+        model = harness.model
+        return {
+            (relation.id, name): dict(
+                harness.get_relation_data(relation.id, name)
+            )
+            for relation_name in harness.charm.meta.relations
+            for relation in model.relations[relation_name]
+            for name in (model.app.name, model.unit.name)
+        }
+
+    def results(self):
+        """Return the summary of the recorded hooks."""
+        hooks = len(self.times)
+        return {
+            'hooks': hooks,
+            'wall_time': round(sum(self.times), 6),
+            'mean_hook_ms': round(sum(self.times) / hooks * 1000, 3)
+            if hooks else 0,
+            'max_hook_ms': round(max(self.times) * 1000, 3)
+            if hooks else 0,
+            'bytes_written': sum(self.writes),
+            'config_changes': len(self.writes),
+            'mean_change_bytes': sum(self.writes) // len(self.writes)
+            if self.writes else 0,
+        }
+
+
+def make_harness(charm_cls):
+    """Return a Harness for charm_cls with its unit as the leader."""
+    harness = Harness(charm_cls)
+    harness.set_leader(True)
+    return harness
+
+
+def deploy_slurmd(recorder, app_index, units):
+    """Deploy one slurmd application and return (harness, peer, app data)."""
+    inventory = make_inventory(units, f"p{app_index}-node", app_index)
+
+    harness = make_harness(SlurmdCharm)
+    harness.update_config({'partition-name': f"partition{app_index}"})
+    # The peer relation is created before begin() so that the leader does
+    # not probe the hardware of the machine running the benchmark.
+    peer = harness.add_relation('slurmd-peer', 'slurmd')
+    harness.update_relation_data(peer, 'slurmd/0', {
+        'ingress-address': inventory[0]['node_addr'],
+        'inventory': json.dumps(inventory[0]),
+    })
+    harness.begin()
+    recorder.run(harness, harness.charm.on.install.emit)
+
+    relation_id = recorder.run(
+        harness,
+        harness.add_relation,
+        'slurmd',
+        'slurm-configurator',
+    )
+    for unit, node in enumerate(inventory[1:], 1):
+        recorder.run(
+            harness,
+            harness.add_relation_unit,
+            peer,
+            f"slurmd/{unit}",
+        )
+        recorder.run(
+            harness,
+            harness.update_relation_data,
+            peer,
+            f"slurmd/{unit}",
+            {'inventory': json.dumps(node)},
+        )
+    return harness, peer, harness.get_relation_data(relation_id, 'slurmd')
+
+
+def deploy_configurator(recorder, slurmd_app_data):
+    """Deploy slurm-configurator and relate the slurmd applications."""
+    harness = make_harness(SlurmConfiguratorCharm)
+    harness.begin()
+    recorder.run(harness, harness.charm.on.install.emit)
+
+    def relate(relation_name, app, app_data):
+        relation_id = recorder.run(
+            harness,
+            harness.add_relation,
+            relation_name,
+            app,
+        )
+        recorder.run(
+            harness,
+            harness.add_relation_unit,
+            relation_id,
+            f"{app}/0",
+        )
+        recorder.run(
+            harness,
+            harness.update_relation_data,
+            relation_id,
+            app,
+            app_data,
+        )
+        return relation_id
+
+    slurmctld_relation_id = relate('slurmctld', 'slurmctld', {
+        'slurmctld_info': json.dumps(SLURMCTLD_INFO),
+        'payload_features': ",".join(SLURMCTLD_PAYLOAD_FEATURES),
+    })
+    relate('slurmdbd', 'slurmdbd', {
+        'slurmdbd_info': json.dumps(SLURMDBD_INFO),
+    })
+    slurmd_relation_ids = [
+        relate('slurmd', f"slurmd{app_index}", dict(app_data))
+        for app_index, app_data in enumerate(slurmd_app_data)
+    ]
+    return harness, slurmctld_relation_id, slurmd_relation_ids
+
+
+def deploy_slurmctld(recorder, slurm_config_app_data):
+    """Deploy slurmctld and hand it the slurm_config."""
+    harness = make_harness(SlurmctldCharm)
+    harness.begin()
+    recorder.run(harness, harness.charm.on.install.emit)
+
+    relation_id = recorder.run(
+        harness,
+        harness.add_relation,
+        'slurmctld',
+        'slurm-configurator',
+    )
+    recorder.run(
+        harness,
+        harness.add_relation_unit,
+        relation_id,
+        'slurm-configurator/0',
+    )
+    recorder.run(
+        harness,
+        harness.update_relation_data,
+        relation_id,
+        'slurm-configurator',
+        slurm_config_app_data,
+    )
+    return harness, relation_id
+
+
+def run_scenario(apps, units):
+    """Run the pipeline for apps x units and return the stage results."""
+    recorders = {
+        stage: HookRecorder()
+        for stage in (
+            'slurmd', 'configurator', 'slurmctld', 'change', 'config',
+        )
+    }
+
+    slurmd_app_data = []
+    first_slurmd = None
+    for app_index in range(apps):
+        harness, peer, app_data = deploy_slurmd(
+            recorders['slurmd'],
+            app_index,
+            units,
+        )
+        slurmd_app_data.append(dict(app_data))
+        # Only the first application is kept around for the change stage.
+        if first_slurmd is None:
+            first_slurmd = harness, peer, app_data
+
+    configurator, slurmctld_relation_id, slurmd_relation_ids = \
+        deploy_configurator(recorders['configurator'], slurmd_app_data)
+    slurm_config_app_data = configurator.get_relation_data(
+        slurmctld_relation_id,
+        'slurm-configurator',
+    )
+    slurmctld, relation_id = deploy_slurmctld(
+        recorders['slurmctld'],
+        dict(slurm_config_app_data),
+    )
+
+    # One node of the first application gets more memory.
+    change = recorders['change']
+    harness, peer, app_data = first_slurmd
+    node = make_inventory(units, "p0-node", 0)[-1]
+    node['real_memory'] = str(int(node['real_memory']) * 2)
+    unit = f"slurmd/{units - 1}"
+    change.run(harness, harness.update_relation_data, peer, unit, {
+        'inventory': json.dumps(node),
+    })
+    change.run(
+        configurator,
+        configurator.update_relation_data,
+        slurmd_relation_ids[0],
+        'slurmd0',
+        dict(app_data),
+    )
+    change.run(
+        slurmctld,
+        slurmctld.update_relation_data,
+        relation_id,
+        'slurm-configurator',
+        dict(slurm_config_app_data),
+    )
+
+    recorders['config'].run(
+        configurator,
+        configurator.update_config,
+        {'cluster_name': "bench-renamed"},
+    )
+
+    return {
+        'apps': apps,
+        'units': units,
+        'stages': {
+            stage: recorder.results()
+            for stage, recorder in recorders.items()
+        },
+    }
+
+
+def parse_scenario(scenario):
+    """Return (apps, units) from 'APPSxUNITS'."""
+    apps, _, units = scenario.partition("x")
+    return int(apps), int(units)
+
+
+def main():
+    """Run the scenarios and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', type=parse_scenario,
+                        default=[(1, 10), (10, 50), (50, 200)],
+                        help="slurmd applications x units, e.g. 50x200")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    print(f"{'scenario':>10} {'stage':<13} {'hooks':>7} {'wall (s)':>9} "
+          f"{'mean (ms)':>10} {'max (ms)':>9} {'bytes':>11} "
+          f"{'changes':>8} {'bytes/change':>13}")
+    results = []
+    for apps, units in args.scenarios:
+        result = run_scenario(apps, units)
+        results.append(result)
+        for stage, r in result['stages'].items():
+            print(f"{apps:>5}x{units:<4} {stage:<13} {r['hooks']:>7} "
+                  f"{r['wall_time']:>9.3f} {r['mean_hook_ms']:>10.3f} "
+                  f"{r['max_hook_ms']:>9.3f} {r['bytes_written']:>11} "
+                  f"{r['config_changes']:>8} {r['mean_change_bytes']:>13}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+"""Microbenchmarks of the slurmd charm hot path.
+
+Times utils.get_inventory against fixture /proc and /sys trees, and
+SlurmdPeer.get_slurmd_info, SlurmdCharm._assemble_slurmd_info,
+SlurmdCharm._assemble_partition and the relation-changed hook of a joining
+unit against peer sets of increasing size, run under ops.testing.Harness.
+
+The results are printed and written as JSON to the --output file.
+
+Usage: python3 benchmarks/bench_slurmd.py [--output FILE] [node_count ...]
+"""
+import argparse
+import json
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+from common import (
+    load_charm_class,
+    load_charm_module,
+    make_inventory,
+    timeit,
+)
+from ops.testing import Harness
+
+
+slurmd_probe = load_charm_module('charm-slurmd', 'probe')
+slurmd_utils = load_charm_module('charm-slurmd', 'utils')
+SlurmdCharm = load_charm_class('charm-slurmd', 'SlurmdCharm')
+
+
+# name: (sockets, cores_per_socket, threads_per_core, memory_mb, gpus)
+HARDWARE = {
+    'small': (1, 2, 2, 8192, 0),
+    'large': (2, 32, 2, 1048576, 8),
+}
+
+
+def make_hardware_tree(root, sockets, cores, threads, memory_mb, gpus):
+    """Write a fixture /proc and /sys tree of the given hardware to root."""
+    def write(path, content):
+        path = Path(root) / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    cpus = sockets * cores * threads
+    write("proc/sys/kernel/random/boot_id",
+          "2b1b6c1e-0c3a-4f5e-9a0d-benchmark000\n")
+    write("proc/meminfo", f"MemTotal:       {memory_mb * 1024} kB\n"
+                          "MemFree:         1024 kB\n")
+    write("sys/devices/system/cpu/online", f"0-{cpus - 1}\n")
+    cpuinfo = []
+    for cpu in range(cpus):
+        # Linux numbers the first thread of every core first.
+        core = cpu % (sockets * cores)
+        package_id, core_id = divmod(core, cores)
+        topology = f"sys/devices/system/cpu/cpu{cpu}/topology"
+        write(f"{topology}/physical_package_id", f"{package_id}\n")
+        write(f"{topology}/core_id", f"{core_id}\n")
+        cpuinfo.append(f"processor\t: {cpu}\nphysical id\t: {package_id}\n"
+                       f"core id\t\t: {core_id}\n")
+    write("proc/cpuinfo", "\n".join(cpuinfo))
+    for gpu in range(gpus):
+        # The gpus are spread over the sockets, local to the cpus of theirs.
+        pci_address = f"0000:{gpu + 0x10:02x}:00.0"
+        device = f"sys/bus/pci/devices/{pci_address}"
+        numa_node = gpu * sockets // gpus
+        local_cpus = [
+            cpu for cpu in range(cpus)
+            if cpu % (sockets * cores) // cores == numa_node
+        ]
+        write(f"{device}/vendor", "0x10de\n")
+        write(f"{device}/class", "0x030200\n")
+        write(f"{device}/device", "0x20b0\n")
+        write(f"{device}/numa_node", f"{numa_node}\n")
+        write(f"{device}/local_cpulist",
+              f"{slurmd_probe.format_cpu_list(local_cpus)}\n")
+        write(f"proc/driver/nvidia/gpus/{pci_address}/information",
+              "Model: \t\t NVIDIA A100-SXM4-40GB\n"
+              f"Device Minor: \t {gpu}\n")
+        write(f"dev/nvidia{gpu}", "")
+
+
+def bench_get_inventory(tmp_dir):
+    """Time get_inventory with and without the hardware cache."""
+    results = []
+    for name, hardware in HARDWARE.items():
+        root = Path(tmp_dir) / name
+        make_hardware_tree(root, *hardware)
+        cache_file = root / ".inventory.json"
+        slurmd_utils.get_inventory("node", "10.0.0.1", cache_file, root=root)
+
+        for variant, kwargs in (
+            ('probe', {'root': root}),
+            ('cached', {'cache_file': cache_file, 'root': root}),
+        ):
+            best = timeit(
+                lambda: slurmd_utils.get_inventory(
+                    "node", "10.0.0.1", **kwargs
+                ),
+                repeat=20,
+            )
+            results.append({
+                'benchmark': f"get_inventory[{variant}]",
+                'hardware': name,
+                'nodes': 1,
+                'best_s': best,
+            })
+    return results
+
+
+def make_peer_harness(node_count):
+    """Return a leader slurmd Harness with node_count units in the peer."""
+    inventory = make_inventory(node_count)
+
+    harness = Harness(SlurmdCharm)
+    harness.set_leader(True)
+    harness.update_config({'partition-name': "bench"})
+    # Relations are created before begin() so that no hook runs, and the
+    # leader does not probe the hardware of the machine running this.
+    peer = harness.add_relation('slurmd-peer', 'slurmd')
+    harness.add_relation('slurmd', 'slurm-configurator')
+    harness.update_relation_data(peer, 'slurmd/0', {
+        'ingress-address': inventory[0]['node_addr'],
+        'inventory': json.dumps(inventory[0]),
+    })
+    # Harness.add_relation_unit() rebuilds the relation on every call, which
+    # makes setting up 10k units quadratic. The units are written to the
+    # Harness backend directly instead, the way add_relation_unit() does.
+    backend = harness._backend
+    for unit, node in enumerate(inventory[1:], 1):
+        unit_name = f"slurmd/{unit}"
+        backend._relation_list_map[peer].append(unit_name)
+        backend._relation_app_and_units[peer]['units'].append(unit_name)
+        backend._relation_data[peer][unit_name] = {
+            'inventory': json.dumps(node),
+        }
+    harness.model.relations._invalidate('slurmd-peer')
+    harness.begin()
+    harness.charm._stored.partition_name = "bench"
+    return harness, peer
+
+
+def bench_peers(node_count):
+    """Time the partition assembly of a peer set of node_count units."""
+    harness, peer = make_peer_harness(node_count)
+    charm = harness.charm
+    slurmd_peer = charm._slurmd_peer
+
+    def join():
+        # The last unit re-publishing its inventory, as a joining unit does.
+        node = make_inventory(1, "joining")[0]
+        node['real_memory'] = str(time.perf_counter_ns())
+        harness.update_relation_data(peer, f"slurmd/{node_count - 1}", {
+            'inventory': json.dumps(node),
+        })
+        harness.framework.commit()
+
+    benchmarks = {
+        'get_slurmd_info': slurmd_peer.get_slurmd_info,
+        '_assemble_slurmd_info': charm._assemble_slurmd_info,
+        '_assemble_partition': charm._assemble_partition,
+    }
+    # The leader is the only unit of a single node peer set.
+    if node_count > 1:
+        benchmarks['peer_relation_changed'] = join
+    charm._stored.node_states = {
+        f"node{i:05d}": "DRAIN" for i in range(0, node_count, 10)
+    }
+    return [
+        {
+            'benchmark': name,
+            'hardware': None,
+            'nodes': node_count,
+            'best_s': timeit(func),
+        }
+        for name, func in benchmarks.items()
+    ]
+
+
+def main():
+    """Run the benchmarks, print and write the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('node_counts', nargs='*', type=int,
+                        default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--output', default="bench_slurmd.json",
+                        help="JSON results file (default: %(default)s)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = bench_get_inventory(tmp_dir)
+    for node_count in args.node_counts:
+        results.extend(bench_peers(node_count))
+
+    print(f"{'benchmark':<28} {'hardware':<9} {'nodes':>6} "
+          f"{'best (ms)':>10} {'per node (us)':>14}")
+    for result in results:
+        result['per_node_us'] = result['best_s'] / result['nodes'] * 1e6
+        print(f"{result['benchmark']:<28} {result['hardware'] or '-':<9} "
+              f"{result['nodes']:>6} {result['best_s'] * 1000:>10.3f} "
+              f"{result['per_node_us']:>14.1f}")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'results': results,
+        }, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""Shared helpers for the charm benchmarks."""
+import atexit
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKES_DIR = os.path.join(REPO_DIR, 'benchmarks', 'fakes')
+
+# The charms write the slurm.conf include files here instead of the snap.
+SLURM_CONF_DIR = tempfile.mkdtemp(prefix="bench-slurm-conf-")
+atexit.register(shutil.rmtree, SLURM_CONF_DIR, ignore_errors=True)
+
+
+def load_charm_module(charm, module_name):
+    """Import module_name from the src dir of charm.
+
+    Each charm ships its own charm.py, utils.py, interface_*.py, so the
+    modules of one charm are imported in isolation and removed from
+    sys.modules again so that the next charm can import its own.
+    """
+    src_dir = os.path.join(REPO_DIR, charm, 'src')
+    local_modules = [
+        f[:-3] for f in os.listdir(src_dir) if f.endswith('.py')
+    ]
+    saved = {
+        name: sys.modules.pop(name)
+        for name in local_modules if name in sys.modules
+    }
+    sys.path.insert(0, src_dir)
+    try:
+        module = importlib.import_module(module_name)
+    finally:
+        sys.path.remove(src_dir)
+        for name in local_modules:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+    return module
+
+
+def load_charm_class(charm, class_name):
+    """Return the charm class of charm, ready to be run under Harness.
+
+    The charms import slurm_ops_manager and friends, which are replaced by
+    the stand-ins in benchmarks/fakes, and write the partition include files
+    to a temporary SLURM_CONF_DIR. Harness locates the charm dir, and
+    with it the yaml files, through the module of the charm class, so the
+    module is kept importable under a name of its own.
+    """
+    if FAKES_DIR not in sys.path:
+        sys.path.insert(0, FAKES_DIR)
+    module = load_charm_module(charm, 'charm')
+    module_name = f"{charm.replace('-', '_')}_charm"
+    sys.modules[module_name] = module
+    charm_cls = getattr(module, class_name)
+    charm_cls.__module__ = module_name
+
+    include_partition_files = getattr(module, 'include_partition_files', None)
+    if include_partition_files:
+        include_partition_files.__globals__['SLURM_CONF_DIR'] = \
+            Path(SLURM_CONF_DIR)
+    return charm_cls
+
+
+def make_inventory(count, prefix="node", partition_index=0):
+    """Return a synthetic homogeneous slurmd inventory of count nodes."""
+    return [
+        {
+            'node_name': f"{prefix}{i:05d}",
+            'node_addr': f"10.{partition_index}.{i // 256}.{i % 256}",
+            'state': "UNKNOWN",
+            'real_memory': 257000,
+            'cpus': 64,
+            'threads_per_core': 2,
+            'cores_per_socket': 16,
+            'sockets_per_board': 2,
+        }
+        for i in range(count)
+    ]
+
+
+def timeit(func, *args, repeat=5):
+    """Return the best wall time in seconds of repeat calls to func."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
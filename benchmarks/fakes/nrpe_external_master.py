@@ -0,0 +1,7 @@
+#!/usr/bin/python3
+"""Stand-in for the nrpe-external-master interface."""
+from ops.framework import Object
+
+
+class Nrpe(Object):
+    """Observe nothing, the benchmark has no nagios."""
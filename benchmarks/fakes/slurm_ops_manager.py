@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+"""Stand-in for slurm_ops_manager used by the pipeline benchmark.
+
+The real SlurmManager installs the slurm snap, renders the configs and
+restarts the daemons. The benchmark only measures the charm side, so this
+one records the configs it is asked to render instead.
+"""
+from ops.framework import Object
+
+
+class SlurmManager(Object):
+    """Record rendered configs instead of touching the system."""
+
+    def __init__(self, charm, component):
+        """Set the attributes the charms read from the slurm manager."""
+        super().__init__(charm, component)
+        self.slurm_component = component
+        self.hostname = charm.unit.name.replace("/", "-")
+        self.port = "6817"
+        self.rendered = []
+
+    def install(self):
+        """Do nothing, there is nothing to install."""
+
+    def upgrade(self, *args):
+        """Do nothing, there is nothing to upgrade."""
+
+    def get_munge_key(self):
+        """Return a fixed munge key."""
+        return "bWVuZ2Uta2V5"
+
+    def render_config_and_restart(self, config):
+        """Record config."""
+        self.rendered.append(config)
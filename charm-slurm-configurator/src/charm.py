@@ -1,8 +1,13 @@
 #!/usr/bin/python3
 """SlurmctldCharm."""
-import copy
 import logging
 
+from config_sections import (
+    get_section_hashes,
+    merge_sections,
+    PARTITION_PREFIX,
+)
+from hook_profiler import HookProfiler
 from interface_elasticsearch import Elasticsearch
 from interface_grafana_source import GrafanaSource
 from interface_influxdb import InfluxDB
@@ -19,6 +24,12 @@ from ops.model import (
     BlockedStatus,
 )
 from slurm_ops_manager import SlurmManager
+from utils import (
+    get_config_version,
+    group_nodes,
+    set_default_partition,
+    set_node_weights,
+)
 
 
 logger = logging.getLogger()
@@ -33,9 +44,12 @@ class SlurmConfiguratorCharm(CharmBase):
         """Init charm, _stored defaults, interfaces and observe events."""
         super().__init__(*args)
 
+        self._profiler = HookProfiler(self, "hook-profiler")
+
         self._stored.set_default(
             default_partition=str(),
             munge_key=str(),
+            slurm_config_pending=False,
             slurm_installed=False,
             slurmctld_available=False,
             slurmdbd_available=False,
@@ -65,6 +79,8 @@ class SlurmConfiguratorCharm(CharmBase):
 
             self.on.upgrade_charm: self._on_upgrade,
 
+            self.on.update_status: self._on_update_status,
+
             # ######## Addons lifecycle events ######## #
             self._elasticsearch.on.elasticsearch_available:
             self._on_check_status_and_write_config,
@@ -110,7 +126,14 @@ class SlurmConfiguratorCharm(CharmBase):
             self._on_check_status_and_write_config,
         }
         for event, handler in event_handler_bindings.items():
-            self.framework.observe(event, handler)
+            self.framework.observe(event, self._profiler.instrument(handler))
+
+        # Number of times the slurm_config was triggered in this dispatch.
+        self._slurm_config_triggers = 0
+        self.framework.observe(
+            self.framework.on.pre_commit,
+            self._profiler.instrument(self._on_pre_commit),
+        )
 
     def _on_install(self, event):
         """Install the slurm snap and set the munge key."""
@@ -132,6 +155,11 @@ class SlurmConfiguratorCharm(CharmBase):
 
         self._slurm_manager.upgrade(slurm_config)
 
+    def _on_update_status(self, event):
+        """Retry a slurm_config that could not be assembled earlier."""
+        if self._stored.slurm_config_pending and self._check_status():
+            self._slurm_config_triggers += 1
+
     def _on_grafana_available(self, event):
         """Create the grafana-source if we are the leader and have influxdb."""
         leader = self._is_leader()
@@ -153,35 +181,103 @@ class SlurmConfiguratorCharm(CharmBase):
         self._on_check_status_and_write_config(event)
 
     def _on_check_status_and_write_config(self, event):
-        """Check that we have what we need before we proceed."""
+        """Check that we have what we need before we proceed.
+
+        The slurm_config is not assembled here, the event only marks it as
+        dirty. A single dispatch can run this handler many times (deferred
+        events being re-emitted, several slurmd applications, chained addon
+        events), the config is assembled and published once, on pre_commit.
+        """
         if not self._check_status():
             event.defer()
             return
 
+        self._slurm_config_triggers += 1
+
+    def _on_pre_commit(self, event):
+        """Assemble and publish the slurm_config if it has been triggered."""
+        if not self._slurm_config_triggers:
+            return
+
+        logger.debug(
+            f"Coalesced {self._slurm_config_triggers} slurm_config "
+            "trigger(s) into a single assembly."
+        )
+        self._slurm_config_triggers = 0
+
+        if not self._is_leader():
+            return
+        self._write_config()
+
+    def _write_config(self):
+        """Assemble the slurm_config and publish it on the relations."""
         # Generate the slurm_config
-        slurm_config = self._assemble_slurm_config()
+        slurm_config_sections = self._assemble_slurm_config_sections()
 
-        if not slurm_config:
+        # Any of slurmctld_info, slurmdbd_info or slurmd_info becoming
+        # available emits an event that triggers us again, update-status
+        # retries in case that event was missed.
+        if not slurm_config_sections:
             self.unit.status = BlockedStatus(
-                "Cannot generate slurm_config - defering event."
+                "Cannot generate slurm_config - waiting for component info."
             )
-            event.defer()
+            self._stored.slurm_config_pending = True
             return
+        self._stored.slurm_config_pending = False
+
+        # Only publish the slurm_config to relations that do not already
+        # have this version of it. Every write to the app relation data
+        # triggers a relation-changed hook on each unit of the related
+        # applications, so republishing an identical config is never free.
+        # Relations that take the slurm_config in sections only get the
+        # sections whose hash changed.
+        section_hashes = get_section_hashes(slurm_config_sections)
+        slurm_config_version = get_config_version(section_hashes)
 
         self._slurmctld.set_slurm_config_on_app_relation_data(
-            slurm_config,
+            slurm_config_sections,
+            slurm_config_version,
+            section_hashes,
         )
 
+        # In configless mode the slurmd units that can run configless fetch
+        # their config from slurmctld, so they only need to know where the
+        # controllers are. slurmctld itself picks up the 'configless' flag
+        # from the core section.
+        configless_sections = None
+        if slurm_config_sections['core'].get('configless'):
+            configless_sections = {
+                'core': self._assemble_configless_slurmd_config(
+                    slurm_config_sections['core']
+                ),
+            }
         self._slurmd.set_slurm_config_on_app_relation_data(
-            slurm_config,
+            slurm_config_sections,
+            slurm_config_version,
+            section_hashes,
+            configless_sections,
         )
+
         if self._stored.slurmrestd_available:
             self._slurmrestd.set_slurm_config_on_app_relation_data(
-                slurm_config,
+                slurm_config_sections,
+                slurm_config_version,
+                section_hashes,
             )
 
     def _assemble_slurm_config(self):
         """Assemble and return the slurm config."""
+        slurm_config_sections = self._assemble_slurm_config_sections()
+        if not slurm_config_sections:
+            return None
+        return merge_sections(slurm_config_sections)
+
+    def _assemble_slurm_config_sections(self):
+        """Assemble and return the slurm config, split into sections.
+
+        The sections are versioned independently, a change to one partition
+        leaves the core, accounting and addons sections untouched.
+        """
         slurmctld_info = self._slurmctld.get_slurmctld_info()
         slurmdbd_info = self._slurmdbd.get_slurmdbd_info()
         slurmd_info = self._slurmd.get_slurmd_info()
@@ -193,31 +289,78 @@ class SlurmConfiguratorCharm(CharmBase):
         partitions_info = self._assemble_partitions(slurmd_info)
 
         logger.debug(addons_info)
-        logger.debug(partitions_info)
+        logger.debug(
+            [partition.partition_name for partition in partitions_info]
+        )
         logger.debug(slurmctld_info)
         logger.debug(slurmdbd_info)
 
         return {
-            'munge_key': self._stored.munge_key,
-            'partitions': partitions_info,
-            **slurmctld_info,
-            **slurmdbd_info,
-            **addons_info,
-            **self.model.config,
+            'core': {
+                'munge_key': self._stored.munge_key,
+                **slurmctld_info,
+                **self.model.config,
+                'configless': self._configless_enabled(),
+            },
+            'accounting': slurmdbd_info,
+            'addons': addons_info,
+            **{
+                f"{PARTITION_PREFIX}{partition.partition_name}":
+                partition.to_dict()
+                for partition in partitions_info
+            },
+        }
+
+    def _configless_enabled(self):
+        """Return True if slurm is configured and able to run configless."""
+        if not self.model.config.get('configless'):
+            return False
+        if not self._slurmctld.supports_configless():
+            logger.warning(
+                "slurmctld cannot run configless, rendering the slurm "
+                "config files on every node instead."
+            )
+            return False
+        return True
+
+    def _assemble_configless_slurmd_config(self, slurm_config):
+        """Assemble the minimal config slurmd needs to run configless."""
+        conf_servers = [
+            f"{slurm_config['active_controller_ingress_address']}:"
+            f"{slurm_config['active_controller_port']}"
+        ]
+        if slurm_config.get('backup_controller_ingress_address'):
+            conf_servers.append(
+                f"{slurm_config['backup_controller_ingress_address']}:"
+                f"{slurm_config['backup_controller_port']}"
+            )
+
+        return {
+            'configless': True,
+            'conf_server': ",".join(conf_servers),
+            'munge_key': slurm_config['munge_key'],
         }
 
     def _assemble_partitions(self, slurmd_info):
         """Make any needed modifications to partition data."""
-        slurmd_info_tmp = copy.deepcopy(slurmd_info)
-
-        for partition in slurmd_info:
-            partition_tmp = copy.deepcopy(partition)
-            if partition['partition_name'] == self._stored.default_partition:
-                partition_tmp['partition_default'] = 'YES'
-                slurmd_info_tmp.remove(partition)
-                slurmd_info_tmp.append(partition_tmp)
+        partitions = set_default_partition(
+            slurmd_info,
+            self._stored.default_partition,
+        )
 
-        return slurmd_info_tmp
+        # Fold nodes with identical hardware into hostlist expressions so
+        # that large homogeneous partitions render as a handful of lines.
+        if self.model.config.get('compress_node_names'):
+            partitions = [
+                partition.replace(inventory=group_nodes(partition.inventory))
+                for partition in partitions
+            ]
+
+        # The weights compare the nodes as ints, the records hold them so.
+        return set_node_weights(
+            partitions,
+            self.model.config.get('node_weight_criteria'),
+        )
 
     def _assemble_addons(self):
         """Assemble any addon components."""
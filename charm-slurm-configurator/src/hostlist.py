@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+"""Slurm hostlist expressions.
+
+Compress lists of hostnames into hostlist expressions, e.g.
+['node001', 'node002', 'node003'] -> 'node[001-003]', and expand them back.
+"""
+import re
+
+
+_HOSTNAME_RE = re.compile(r"^(.*?)(\d+)$")
+_HOSTLIST_RE = re.compile(r"^([^\[\]]*)\[([^\[\]]+)\]([^\[\]]*)$")
+
+
+def _split_hostname(hostname):
+    """Split a hostname into (prefix, width, number).
+
+    The width is only significant for zero padded numbers, unpadded numbers
+    all share a width of 0 so that node9 and node10 can share a range.
+    """
+    match = _HOSTNAME_RE.match(hostname)
+    if not match:
+        return (hostname, -1, None)
+    prefix, digits = match.groups()
+    width = len(digits) if digits[0] == "0" and len(digits) > 1 else 0
+    return (prefix, width, int(digits))
+
+
+def _sort_key(hostname):
+    """Return the key that orders hostnames numerically."""
+    prefix, width, number = _split_hostname(hostname)
+    return (prefix, width, -1 if number is None else number)
+
+
+def _format_range(start, end, width):
+    """Return a single range of a hostlist expression."""
+    if start == end:
+        return f"{start:0{width}d}"
+    return f"{start:0{width}d}-{end:0{width}d}"
+
+
+def _ranges(numbers, width):
+    """Return the ranges that cover the sorted list of numbers."""
+    ranges = []
+    start = end = numbers[0]
+    for number in numbers[1:]:
+        if number == end + 1:
+            end = number
+            continue
+        ranges.append(_format_range(start, end, width))
+        start = end = number
+    ranges.append(_format_range(start, end, width))
+    return ranges
+
+
+def compress(hostnames):
+    """Return the hostlist expression for hostnames.
+
+    The order of the hostnames is not preserved, use expand() on the result
+    to get the order that slurm will see them in.
+    """
+    groups = dict()
+    for hostname in sorted(set(hostnames), key=_sort_key):
+        prefix, width, number = _split_hostname(hostname)
+        groups.setdefault((prefix, width), []).append(number)
+
+    # Unpadded numbers that are as wide as a zero padded range belong to
+    # that range, e.g. node100 extends node[001-099] to node[001-100].
+    for (prefix, width), numbers in list(groups.items()):
+        unpadded = groups.get((prefix, 0))
+        if width <= 0 or not unpadded:
+            continue
+        wide = [n for n in unpadded if len(str(n)) == width]
+        if wide:
+            groups[(prefix, width)] = sorted(numbers + wide)
+            groups[(prefix, 0)] = [n for n in unpadded if n not in wide]
+            if not groups[(prefix, 0)]:
+                del groups[(prefix, 0)]
+
+    expressions = []
+    for (prefix, width), numbers in groups.items():
+        if numbers == [None]:
+            expressions.append(prefix)
+            continue
+
+        ranges = _ranges(numbers, width)
+        if len(ranges) == 1 and "-" not in ranges[0]:
+            expressions.append(f"{prefix}{ranges[0]}")
+        else:
+            expressions.append(f"{prefix}[{','.join(ranges)}]")
+
+    return ",".join(expressions)
+
+
+def split_expressions(hostlist):
+    """Split a hostlist on the commas that are not inside brackets."""
+    expressions = []
+    depth = 0
+    current = ""
+    for char in hostlist:
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        if char == "," and depth == 0:
+            expressions.append(current)
+            current = ""
+        else:
+            current += char
+    expressions.append(current)
+    return [expression.strip() for expression in expressions if expression]
+
+
+def expand(hostlist):
+    """Return the list of hostnames in a hostlist expression."""
+    hostnames = []
+    for expression in split_expressions(hostlist):
+        match = _HOSTLIST_RE.match(expression)
+        if not match:
+            hostnames.append(expression)
+            continue
+
+        prefix, ranges, suffix = match.groups()
+        for item in ranges.split(","):
+            start, _, end = item.partition("-")
+            width = len(start) if start.startswith("0") else 0
+            for number in range(int(start), int(end or start) + 1):
+                hostnames.append(f"{prefix}{number:0{width}d}{suffix}")
+    return hostnames
@@ -1,15 +1,20 @@
 #!/usr/bin/python3
 """Slurmdbd."""
-import json
 import logging
 
 
+from config_sections import (
+    CONFIGLESS_FEATURE,
+    get_section_hashes,
+    set_slurm_config_on_relation,
+)
 from ops.framework import (
     EventBase,
     EventSource,
     Object,
     ObjectEvents,
 )
+from payload import advertise_features, decode, supports_feature
 
 
 logger = logging.getLogger()
@@ -72,6 +77,7 @@ class Slurmctld(Object):
         # data on the relation to be retrieved on the other side by slurmdbd.
         app_relation_data = event.relation.data[self.model.app]
         app_relation_data['munge_key'] = self._charm.get_munge_key()
+        advertise_features(event.relation, self.model.app)
 
     def _on_relation_changed(self, event):
         event_app_data = event.relation.data.get(event.app)
@@ -108,23 +114,46 @@ class Slurmctld(Object):
                 if app_data:
                     slurmctld_info = app_data.get('slurmctld_info')
                     if slurmctld_info:
-                        return json.loads(slurmctld_info)
+                        return decode(slurmctld_info, 'slurmctld_info')
         return None
 
+    def supports_configless(self):
+        """Return True if slurmctld can serve its config to slurmd."""
+        relation = self._relation
+        if relation:
+            return supports_feature(relation, CONFIGLESS_FEATURE)
+        return False
+
     def set_slurm_config_on_app_relation_data(
         self,
-        slurm_config,
+        slurm_config_sections,
+        slurm_config_version=str(),
+        section_hashes=None,
     ):
-        """Set the slurm_conifg to the app data on the relation.
+        """Set the slurm_config sections to the app data on the relation.
 
         Setting data on the relation forces the units of related applications
         to observe the relation-changed event so they can acquire and
         render the updated slurm_config.
+
+        Relations that already hold slurm_config_version are left untouched
+        so that an unchanged config never triggers a relation-changed hook.
+        Passing "" clears the slurm_config.
         """
+        slurm_config_sections = slurm_config_sections or dict()
+        if section_hashes is None:
+            section_hashes = get_section_hashes(slurm_config_sections)
+
         relations = self._charm.framework.model.relations['slurmctld']
+        # Encoded once per encoding, not once per relation.
+        payloads = dict()
         for relation in relations:
-            app_relation_data = relation.data[self.model.app]
-            if slurm_config != "":
-                app_relation_data['slurm_config'] = json.dumps(slurm_config)
-            else:
-                app_relation_data['slurm_config'] = slurm_config
+            advertise_features(relation, self.model.app)
+            set_slurm_config_on_relation(
+                relation,
+                self.model.app,
+                slurm_config_sections,
+                section_hashes,
+                slurm_config_version,
+                payloads,
+            )
@@ -1,16 +1,22 @@
 #!/usr/bin/python3
 """Slurmd."""
-import json
 import logging
 
 
+from config_sections import (
+    CONFIGLESS_FEATURE,
+    get_section_hashes,
+    set_slurm_config_on_relation,
+)
+from inventory import InventoryError, PartitionRecord
 from ops.framework import (
     EventBase,
     EventSource,
     Object,
     ObjectEvents,
-    StoredState,
 )
+from payload import advertise_features, decode, supports_feature
+from utils import get_config_version
 
 
 logger = logging.getLogger()
@@ -40,7 +46,6 @@ class Slurmd(Object):
     """Slurmd."""
 
     on = SlurmdRequiresEvents()
-    _state = StoredState()
 
     def __init__(self, charm, relation_name):
         """Set self._relation_name and self.charm."""
@@ -71,6 +76,7 @@ class Slurmd(Object):
         # data on the relation to be retrieved on the other side by slurmdbd.
         app_relation_data = event.relation.data[self.model.app]
         app_relation_data['munge_key'] = self._charm.get_munge_key()
+        advertise_features(event.relation, self.model.app)
 
     def _on_relation_joined(self, event):
         partition_name = event.relation.data[event.app].get('partition_name')
@@ -99,7 +105,11 @@ class Slurmd(Object):
         self._charm.set_slurmd_available(False)
 
     def get_slurmd_info(self):
-        """Return the node info for units of applications on the relation."""
+        """Return the PartitionRecord of each application on the relation.
+
+        A partition that does not match the schema is left out of the
+        slurm_config rather than failing the hook.
+        """
         nodes_info = []
         relations = self.framework.model.relations['slurmd']
 
@@ -110,20 +120,60 @@ class Slurmd(Object):
                 if app_data:
                     slurmd_info = app_data.get('slurmd_info')
                     if slurmd_info:
-                        nodes_info.append(json.loads(slurmd_info))
+                        try:
+                            nodes_info.append(PartitionRecord.from_dict(
+                                decode(slurmd_info, 'slurmd_info')
+                            ))
+                        except InventoryError as e:
+                            logger.error(f"{app.name} slurmd_info: {e}")
         return nodes_info
 
     def set_slurm_config_on_app_relation_data(
         self,
-        slurm_config,
+        slurm_config_sections,
+        slurm_config_version=str(),
+        section_hashes=None,
+        configless_sections=None,
     ):
-        """Set the slurm_conifg to the app data on the relation.
+        """Set the slurm_config sections to the app data on the relation.
 
         Setting data on the relation forces the units of related applications
         to observe the relation-changed event so they can acquire and
         render the updated slurm_config.
+
+        Relations that already hold slurm_config_version are left untouched
+        so that an unchanged config never triggers a relation-changed hook.
+        Passing "" clears the slurm_config.
+
+        configless_sections are sent instead of slurm_config_sections to
+        the slurmd applications that can run configless, the others keep
+        rendering their slurm.conf from the full slurm_config.
         """
+        slurm_config_sections = slurm_config_sections or dict()
+        if section_hashes is None:
+            section_hashes = get_section_hashes(slurm_config_sections)
+
+        # Encoded once per encoding, not once per relation.
+        full = (
+            slurm_config_sections, section_hashes, slurm_config_version,
+            dict(),
+        )
+        configless = full
+        if configless_sections:
+            configless_hashes = get_section_hashes(configless_sections)
+            configless = (
+                configless_sections,
+                configless_hashes,
+                get_config_version(configless_hashes),
+                dict(),
+            )
+
         relations = self._charm.framework.model.relations['slurmd']
         for relation in relations:
-            app_relation_data = relation.data[self.model.app]
-            app_relation_data['slurm_config'] = json.dumps(slurm_config)
+            advertise_features(relation, self.model.app)
+            if supports_feature(relation, CONFIGLESS_FEATURE):
+                set_slurm_config_on_relation(
+                    relation, self.model.app, *configless
+                )
+            else:
+                set_slurm_config_on_relation(relation, self.model.app, *full)
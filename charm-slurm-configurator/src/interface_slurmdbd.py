@@ -1,6 +1,5 @@
 #!/usr/bin/python3
 """Slurmdbd."""
-import json
 import logging
 
 
@@ -10,6 +9,7 @@ from ops.framework import (
     Object,
     ObjectEvents,
 )
+from payload import advertise_features, decode
 
 
 logger = logging.getLogger()
@@ -72,6 +72,7 @@ class Slurmdbd(Object):
         # data on the relation to be retrieved on the other side by slurmdbd.
         munge_key = self._charm.get_munge_key()
         event.relation.data[self.model.app]['munge_key'] = munge_key
+        advertise_features(event.relation, self.model.app)
 
     def _on_relation_changed(self, event):
         event_app_data = event.relation.data.get(event.app)
@@ -107,5 +108,5 @@ class Slurmdbd(Object):
                 if app_data:
                     slurmdbd_info = app_data.get('slurmdbd_info')
                     if slurmdbd_info:
-                        return json.loads(slurmdbd_info)
+                        return decode(slurmdbd_info, 'slurmdbd_info')
         return None
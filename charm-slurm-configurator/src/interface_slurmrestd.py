@@ -1,14 +1,18 @@
 #!/usr/bin/python3
 """SlurmrestdProvides."""
 import logging
-import json
 
+from config_sections import (
+    get_section_hashes,
+    set_slurm_config_on_relation,
+)
 from ops.framework import (
     EventBase,
     EventSource,
     Object,
     ObjectEvents,
 )
+from payload import advertise_features
 
 
 logger = logging.getLogger()
@@ -58,15 +62,34 @@ class Slurmrestd(Object):
 
     def set_slurm_config_on_app_relation_data(
         self,
-        slurm_config,
+        slurm_config_sections,
+        slurm_config_version=str(),
+        section_hashes=None,
     ):
-        """Set the slurm_conifg to the app data on the relation.
+        """Set the slurm_config sections to the app data on the relation.
 
         Setting data on the relation forces the units of related applications
         to observe the relation-changed event so they can acquire and
         render the updated slurm_config.
+
+        Relations that already hold slurm_config_version are left untouched
+        so that an unchanged config never triggers a relation-changed hook.
+        Passing "" clears the slurm_config.
         """
+        slurm_config_sections = slurm_config_sections or dict()
+        if section_hashes is None:
+            section_hashes = get_section_hashes(slurm_config_sections)
+
         relations = self.charm.framework.model.relations['slurmrestd']
+        # Encoded once per encoding, not once per relation.
+        payloads = dict()
         for relation in relations:
-            app_relation_data = relation.data[self.model.app]
-            app_relation_data['slurm_config'] = json.dumps(slurm_config)
+            advertise_features(relation, self.model.app)
+            set_slurm_config_on_relation(
+                relation,
+                self.model.app,
+                slurm_config_sections,
+                section_hashes,
+                slurm_config_version,
+                payloads,
+            )
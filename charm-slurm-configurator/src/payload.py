@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""Encoding of the json payloads set on relation data.
+
+Payloads are set either as plain json, which every version of the charms
+can read, or wrapped in a versioned envelope:
+
+    slurm-payload/1;<encoding>;<body>
+
+where encoding is 'json' for a plain json body or 'zlib' for a base64
+encoded, zlib compressed json body. An application advertises that it can
+read the envelope in the 'payload_features' key of its app data, the
+envelope is only used towards applications that do.
+"""
+import base64
+import json
+import logging
+import zlib
+
+
+logger = logging.getLogger()
+
+
+PAYLOAD_VERSION = "slurm-payload/1"
+FEATURES_KEY = 'payload_features'
+FEATURES = (PAYLOAD_VERSION,)
+
+# Payloads smaller than this are not worth compressing.
+COMPRESS_THRESHOLD = 1024
+
+
+def encode(value, envelope=False, name="payload"):
+    """Return value encoded for relation data.
+
+    Without envelope value is returned as plain json. With envelope it is
+    wrapped in the versioned envelope, compressed if it is large enough.
+    """
+    raw = json.dumps(value, separators=(",", ":"))
+    if not envelope:
+        payload = raw
+    elif len(raw) < COMPRESS_THRESHOLD:
+        payload = f"{PAYLOAD_VERSION};json;{raw}"
+    else:
+        body = base64.b64encode(zlib.compress(raw.encode())).decode()
+        payload = f"{PAYLOAD_VERSION};zlib;{body}"
+    logger.debug(f"{name}: {len(raw)} bytes encoded to {len(payload)}")
+    return payload
+
+
+def decode(payload, name="payload"):
+    """Return the value of an encoded payload, plain json or enveloped."""
+    if not payload.startswith(f"{PAYLOAD_VERSION};"):
+        return json.loads(payload)
+
+    _, encoding, body = payload.split(";", 2)
+    if encoding == "zlib":
+        raw = zlib.decompress(base64.b64decode(body)).decode()
+    elif encoding == "json":
+        raw = body
+    else:
+        raise ValueError(f"Unknown {name} encoding: {encoding}")
+    logger.debug(f"{name}: {len(payload)} bytes decoded to {len(raw)}")
+    return json.loads(raw)
+
+
+def advertise_features(relation, app, features=FEATURES):
+    """Advertise the payload features app can read on relation."""
+    app_relation_data = relation.data[app]
+    features = ",".join(features)
+    if app_relation_data.get(FEATURES_KEY) != features:
+        app_relation_data[FEATURES_KEY] = features
+
+
+def supports_feature(relation, feature):
+    """Return True if the remote app of relation advertises feature."""
+    if not relation.app:
+        return False
+    app_data = relation.data.get(relation.app)
+    if not app_data:
+        return False
+    features = app_data.get(FEATURES_KEY, "")
+    return feature in features.split(",")
+
+
+def supports_envelope(relation):
+    """Return True if the remote app of relation can read the envelope."""
+    return supports_feature(relation, PAYLOAD_VERSION)
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+"""utils.py module for slurm-configurator charm."""
+import hashlib
+import json
+import logging
+
+import hostlist
+
+
+logger = logging.getLogger()
+
+# node_weight_criteria: the NodeRecord field the nodes are weighed by
+WEIGHT_CRITERIA = {
+    'RealMemory': 'real_memory',
+    'CPUs': 'cpus',
+    'CoresPerSocket': 'cores_per_socket',
+    'GPUs': 'gres',
+}
+
+
+def get_config_version(config):
+    """Return a canonical hash of the config.
+
+    The config is serialized with sorted keys so that two configs with the
+    same content always produce the same version, regardless of the order in
+    which they were assembled.
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def group_nodes(inventory):
+    """Group nodes with identical hardware into hostlist expressions.
+
+    Nodes that only differ in node_name and node_addr are folded into a
+    single NodeRecord whose node_name is a hostlist expression and whose
+    node_addr is the comma separated list of addresses in the same order.
+    """
+    groups = dict()
+    for node in inventory:
+        groups.setdefault(node.hardware_key(), []).append(node)
+
+    grouped_inventory = []
+    for nodes in groups.values():
+        if len(nodes) == 1:
+            grouped_inventory.append(nodes[0])
+            continue
+
+        # NodeAddr has to list the addresses in the order that slurm
+        # expands the NodeName hostlist expression in.
+        node_addrs = {node.node_name: node.node_addr for node in nodes}
+        node_name = hostlist.compress(node_addrs.keys())
+        grouped_inventory.append(nodes[0].replace(
+            node_name=node_name,
+            node_addr=",".join(
+                [node_addrs[name] for name in hostlist.expand(node_name)]
+            ),
+        ))
+    return grouped_inventory
+
+
+def set_default_partition(partitions, partition_name):
+    """Return partitions with partition_name flagged as the default.
+
+    Only the default partition is copied, every other partition is passed
+    through as is.
+    """
+    index = {
+        partition.partition_name: i
+        for i, partition in enumerate(partitions)
+    }
+    if partition_name not in index:
+        return partitions
+
+    partitions = list(partitions)
+    i = index[partition_name]
+    partitions[i] = partitions[i].replace(partition_default='YES')
+    return partitions
+
+
+def parse_node_weight_criteria(node_weight_criteria):
+    """Return the NodeRecord fields of criteria such as 'RealMemory,CPUs'.
+
+    Unknown criteria are logged and skipped, 'none' yields no fields.
+    """
+    fields = []
+    for criterion in (node_weight_criteria or "").split(","):
+        criterion = criterion.strip()
+        if not criterion or criterion.lower() == "none":
+            continue
+        if criterion not in WEIGHT_CRITERIA:
+            logger.warning(f"Unknown node_weight_criteria: {criterion}")
+            continue
+        fields.append(WEIGHT_CRITERIA[criterion])
+    return fields
+
+
+def set_node_weights(partitions, node_weight_criteria):
+    """Return partitions with the nodes weighed by node_weight_criteria.
+
+    The nodes of all partitions are weighed in ascending order of the
+    criteria, compared in the order they are listed: 'RealMemory,CPUs'
+    orders by memory, then by cpus. Nodes equal in every criterion share a
+    weight bucket, the buckets are numbered from 1. Without criteria, such
+    as the default 'none', the nodes are left unweighed.
+    """
+    fields = parse_node_weight_criteria(node_weight_criteria)
+    if not fields:
+        return partitions
+
+    nodes = [node for partition in partitions for node in partition.inventory]
+
+    # Read each criterion into a column once and zip the columns into the
+    # sort key of every node, the keys are then ranked in a single sort.
+    columns = [[getattr(node, field) for node in nodes] for field in fields]
+    keys = list(zip(*columns))
+    buckets = {key: weight for weight, key in enumerate(sorted(set(keys)), 1)}
+    logger.debug(f"{len(nodes)} nodes weighed by {fields} into "
+                 f"{len(buckets)} buckets.")
+
+    weights = iter([buckets[key] for key in keys])
+    return [
+        partition.replace(inventory=[
+            node.replace(weight=next(weights)) for node in partition.inventory
+        ])
+        for partition in partitions
+    ]
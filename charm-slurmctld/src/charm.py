@@ -1,7 +1,14 @@
 #!/usr/bin/python3
 """SlurmctldCharm."""
 import logging
+import subprocess
 
+from config_render import (
+    get_changed_keys,
+    get_config_hashes,
+    render_config,
+)
+from hook_profiler import HookProfiler
 from interface_slurmctld import Slurmctld
 from interface_slurmctld_peer import SlurmctldPeer
 from nrpe_external_master import Nrpe
@@ -12,11 +19,24 @@ from ops.model import (
     ActiveStatus,
     BlockedStatus,
 )
+from partition_files import include_partition_files
 from slurm_ops_manager import SlurmManager
 
 
 logger = logging.getLogger()
 
+SCONTROL = "/snap/bin/slurm.scontrol"
+
+# slurm_config keys that slurmctld picks up on 'scontrol reconfigure', a
+# change to any other key (including the node definitions) is a restart.
+RECONFIGURABLE_KEYS = frozenset({
+    'compress_node_names',
+    'nhc',
+    'node_weight_criteria',
+    'partitions',
+    'profiling',
+})
+
 
 class SlurmctldCharm(CharmBase):
     """Slurmctld lifecycle events."""
@@ -27,8 +47,12 @@ class SlurmctldCharm(CharmBase):
         """Init _stored attributes and interfaces, observe events."""
         super().__init__(*args)
 
+        self._profiler = HookProfiler(self, "hook-profiler")
+
         self._stored.set_default(
+            config_hashes=dict(),
             munge_key=str(),
+            slurm_config_version=str(),
             slurmctld_controller_type=str(),
             slurm_configurator_available=False,
         )
@@ -50,7 +74,7 @@ class SlurmctldCharm(CharmBase):
             self._on_slurmctld_peer_available,
         }
         for event, handler in event_handler_bindings.items():
-            self.framework.observe(event, handler)
+            self.framework.observe(event, self._profiler.instrument(handler))
 
     def _on_install(self, event):
         self._slurm_manager.install()
@@ -77,9 +101,27 @@ class SlurmctldCharm(CharmBase):
             return
 
         slurm_config = self._slurmctld.get_slurm_config_from_relation()
+        slurm_config_version = \
+            self._slurmctld.get_slurm_config_version_from_relation()
+
+        # The change detection runs on the partitions themselves, they are
+        # moved to include files only when the config is rendered.
+        config_hashes = get_config_hashes(slurm_config)
+        action = render_config(
+            self._slurm_manager,
+            slurm_config,
+            get_changed_keys(self._stored.config_hashes, config_hashes),
+            RECONFIGURABLE_KEYS,
+            self._reconfigure,
+            include_partition_files,
+        )
+        self._stored.config_hashes = config_hashes
+        self._stored.slurm_config_version = slurm_config_version
+        self.unit.status = ActiveStatus(f"Slurmctld Available ({action})")
 
-        self._slurm_manager.render_config_and_restart(slurm_config)
-        self.unit.status = ActiveStatus("Slurmctld Available")
+    def _reconfigure(self):
+        """Make slurmctld and the slurmd daemons re-read slurm.conf."""
+        subprocess.check_call([SCONTROL, "reconfigure"])
 
     def _check_status(self):
         slurm_installed = self._stored.slurm_installed
@@ -101,10 +143,20 @@ class SlurmctldCharm(CharmBase):
         """Return the hostname."""
         return self._slurm_manager.hostname
 
+    def supports_configless(self):
+        """Return True if slurm-ops-manager can run slurm configless."""
+        return bool(
+            getattr(self._slurm_manager, 'supports_configless', False)
+        )
+
     def get_port(self):
         """Return the port."""
         return self._slurm_manager.port
 
+    def get_slurm_config_version(self):
+        """Return the version of the last rendered slurm_config."""
+        return self._stored.slurm_config_version
+
     def set_slurm_configurator_available(self, boolean):
         """Set configurator status."""
         self._stored.slurm_configurator_available = boolean
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+"""HookProfiler."""
+import cProfile
+import functools
+import json
+import logging
+import os
+import time
+import types
+
+from ops.framework import Object
+
+
+logger = logging.getLogger()
+
+
+PROFILING_ENV = "SLURM_CHARM_PROFILING"
+
+TIMINGS_FILE = ".hook-timings.json"
+PROFILES_DIR = "profiles"
+
+MAX_TIMINGS = 100
+MAX_PROFILES = 100
+
+
+class HookProfiler(Object):
+    """Record the wall time of the observed handlers of each dispatch.
+
+    Profiling is opt-in, it is enabled by the 'profiling' charm config or by
+    setting SLURM_CHARM_PROFILING=1 in the environment of the dispatch. When
+    enabled, the wall time of every instrumented handler and of the whole
+    dispatch are appended to .hook-timings.json in the charm dir, and the
+    cProfile output of the dispatch is written to profiles/.
+    """
+
+    def __init__(self, charm, key):
+        """Start the dispatch timer and profiler if profiling is enabled."""
+        super().__init__(charm, key)
+        self._charm = charm
+
+        self._started = time.perf_counter()
+        self._handler_timings = dict()
+        self._in_handler = False
+        self._profile = None
+
+        env = os.environ.get(PROFILING_ENV, "").lower()
+        self._enabled = env in ("1", "true", "yes") or \
+            bool(self._charm.model.config.get('profiling'))
+
+        if self._enabled:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            self.framework.observe(self.framework.on.commit, self._on_commit)
+
+        self.framework.observe(
+            self._charm.on.show_hook_timings_action,
+            self._on_show_hook_timings_action,
+        )
+
+    @property
+    def enabled(self):
+        """Return True if profiling is enabled."""
+        return self._enabled
+
+    @property
+    def _timings_file(self):
+        return self._charm.charm_dir / TIMINGS_FILE
+
+    def instrument(self, handler):
+        """Return handler wrapped to record its wall time.
+
+        The wrapper replaces the handler on its observer, because the
+        framework looks the handler up by name when it emits the event.
+        A handler called from another instrumented handler is not timed on
+        its own, its time is already part of the caller's. Returns handler
+        unchanged when profiling is disabled.
+        """
+        if not self.enabled:
+            return handler
+
+        observer = handler.__self__
+        func = handler.__func__
+        name = f"{type(observer).__name__}.{handler.__name__}"
+
+        @functools.wraps(func)
+        def timed_handler(obj, event):
+            if self._in_handler:
+                return func(obj, event)
+
+            self._in_handler = True
+            start = time.perf_counter()
+            try:
+                return func(obj, event)
+            finally:
+                self._in_handler = False
+                self._handler_timings[name] = \
+                    self._handler_timings.get(name, 0) + \
+                    time.perf_counter() - start
+
+        timed_method = types.MethodType(timed_handler, observer)
+        setattr(observer, handler.__name__, timed_method)
+        return timed_method
+
+    def _on_commit(self, event):
+        """Write the timings and profile of this dispatch."""
+        self._profile.disable()
+
+        hook = os.path.basename(
+            os.environ.get("JUJU_DISPATCH_PATH", "") or
+            os.environ.get("JUJU_HOOK_NAME", "unknown")
+        )
+        timing = {
+            'hook': hook,
+            'unit': self._charm.unit.name,
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'wall_time': round(time.perf_counter() - self._started, 6),
+            'handlers': {
+                name: round(elapsed, 6)
+                for name, elapsed in self._handler_timings.items()
+            },
+        }
+        logger.debug(f"hook timing: {timing}")
+
+        timings = (self._read_timings() + [timing])[-MAX_TIMINGS:]
+        self._timings_file.write_text(json.dumps(timings))
+
+        profiles_dir = self._charm.charm_dir / PROFILES_DIR
+        profiles_dir.mkdir(exist_ok=True)
+        self._profile.dump_stats(
+            str(profiles_dir / f"{time.strftime('%Y%m%dT%H%M%S')}-"
+                               f"{os.getpid()}-{hook}.prof")
+        )
+        for profile in sorted(profiles_dir.iterdir())[:-MAX_PROFILES]:
+            profile.unlink()
+
+    def _read_timings(self):
+        """Return the recorded hook timings."""
+        try:
+            return json.loads(self._timings_file.read_text())
+        except (OSError, ValueError):
+            return []
+
+    def _on_show_hook_timings_action(self, event):
+        """Return the last N hook timings."""
+        count = int(event.params.get("count", 10))
+        timings = self._read_timings()[-count:]
+        event.set_results({
+            'enabled': str(self.enabled),
+            'timings': json.dumps(timings),
+        })
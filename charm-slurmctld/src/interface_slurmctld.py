@@ -1,18 +1,32 @@
 #!/usr/bin/python3
 """Slurmctld."""
-import json
 import logging
 
+from config_sections import (
+    CONFIGLESS_FEATURE,
+    get_slurm_config_from_app_data,
+    has_slurm_config,
+    SECTIONS_FEATURE,
+)
 from ops.framework import (
     EventBase,
     EventSource,
     Object,
     ObjectEvents,
 )
+from payload import (
+    advertise_features,
+    encode,
+    FEATURES,
+    supports_envelope,
+)
 
 
 logger = logging.getLogger()
 
+# The configurator may send us the slurm_config in sections.
+PAYLOAD_FEATURES = (*FEATURES, SECTIONS_FEATURE)
+
 
 class SlurmConfigAvailableEvent(EventBase):
     """Emitted when slurm-config is available."""
@@ -65,6 +79,12 @@ class Slurmctld(Object):
 
     def _on_relation_created(self, event):
         logger.debug("######## CREATED ########")
+        if self.framework.model.unit.is_leader():
+            advertise_features(
+                event.relation,
+                self.model.app,
+                self._payload_features,
+            )
         if event.relation.data.get(event.unit):
             logger.debug(event.relation.data[event.unit].__dict__)
 
@@ -79,11 +99,18 @@ class Slurmctld(Object):
             event.defer()
             return
 
-        slurm_config = event_app_data.get('slurm_config')
-        if not slurm_config:
+        if not has_slurm_config(event_app_data):
             event.defer()
             return
         self._charm.set_slurm_configurator_available(True)
+
+        # The configurator publishes a version alongside the slurm_config,
+        # if we have already rendered this version there is nothing to do.
+        slurm_config_version = event_app_data.get('slurm_config_version')
+        if slurm_config_version and \
+                slurm_config_version == self._charm.get_slurm_config_version():
+            logger.debug(f"slurm_config {slurm_config_version} unchanged.")
+            return
         self.on.slurm_config_available.emit()
 
     def _on_relation_departed(self, event):
@@ -97,6 +124,13 @@ class Slurmctld(Object):
         self._charm.set_slurm_configurator_available(False)
         self.on.slurm_configurator_unavailable.emit()
 
+    @property
+    def _payload_features(self):
+        """Return the features we advertise, configless if we can run it."""
+        if self._charm.supports_configless():
+            return (*PAYLOAD_FEATURES, CONFIGLESS_FEATURE)
+        return PAYLOAD_FEATURES
+
     @property
     def _relation(self):
         return self.framework.model.get_relation(self._relation_name)
@@ -112,8 +146,15 @@ class Slurmctld(Object):
         # Iterate over each of the relations setting the relation data.
         for relation in relations:
             if slurmctld_info != "":
-                relation.data[self.model.app]['slurmctld_info'] = json.dumps(
-                    slurmctld_info
+                advertise_features(
+                    relation,
+                    self.model.app,
+                    self._payload_features,
+                )
+                relation.data[self.model.app]['slurmctld_info'] = encode(
+                    slurmctld_info,
+                    supports_envelope(relation),
+                    'slurmctld_info',
                 )
             else:
                 relation.data[self.model.app]['slurmctld_info'] = ""
@@ -126,10 +167,20 @@ class Slurmctld(Object):
             if app:
                 app_data = relation.data.get(app)
                 if app_data:
-                    if app_data.get('slurm_config'):
-                        return json.loads(app_data['slurm_config'])
+                    return get_slurm_config_from_app_data(app_data)
         return None
 
+    def get_slurm_config_version_from_relation(self):
+        """Return slurm_config_version."""
+        relation = self._relation
+        if relation:
+            app = relation.app
+            if app:
+                app_data = relation.data.get(app)
+                if app_data:
+                    return app_data.get('slurm_config_version', str())
+        return str()
+
     def is_slurm_config_available(self):
         """Return True/False."""
         relation = self._relation
@@ -138,6 +189,5 @@ class Slurmctld(Object):
             if app:
                 app_data = relation.data.get(app)
                 if app_data:
-                    if app_data.get('slurm_config'):
-                        return True
+                    return has_slurm_config(app_data)
         return False
@@ -1,9 +1,7 @@
 #!/usr/bin/python3
 """SlurmctldPeer."""
-import copy
 import json
 import logging
-import subprocess
 
 from ops.framework import (
     EventBase,
@@ -11,6 +9,7 @@ from ops.framework import (
     Object,
     ObjectEvents,
 )
+from payload import decode, encode
 
 
 logger = logging.getLogger()
@@ -77,8 +76,8 @@ class SlurmctldPeer(Object):
             app_relation_data = relation.data[self.model.app]
             unit_relation_data = relation.data[self.model.unit]
 
-            slurmctld_peers = _get_active_peers()
-            slurmctld_peers_tmp = copy.deepcopy(slurmctld_peers)
+            slurmctld_peers = _get_active_peers(relation)
+            slurmctld_peers_tmp = list(slurmctld_peers)
 
             active_controller = app_relation_data.get('active_controller')
             backup_controller = app_relation_data.get('backup_controller')
@@ -162,7 +161,12 @@ class SlurmctldPeer(Object):
                 ctxt['backup_controller_port'] = ""
 
             logger.debug(ctxt)
-            app_relation_data['slurmctld_info'] = json.dumps(ctxt)
+            # Units of this application can run different charm revisions
+            # mid upgrade, so the peer payload is always plain json.
+            app_relation_data['slurmctld_info'] = encode(
+                ctxt,
+                name='slurmctld_info',
+            )
             logger.debug("EMMITTING SLURMCTLD_PEER_AVAILABLE")
             self.on.slurmctld_peer_available.emit()
 
@@ -183,28 +187,14 @@ class SlurmctldPeer(Object):
                 if app_data:
                     slurmctld_info = app_data.get('slurmctld_info')
                     if slurmctld_info:
-                        return json.loads(slurmctld_info)
+                        return decode(slurmctld_info, 'slurmctld_info')
         return None
 
 
-def _related_units(relid):
-    """List of related units."""
-    units_cmd_line = ['relation-list', '--format=json', '-r', relid]
-    return json.loads(
-        subprocess.check_output(units_cmd_line).decode('UTF-8')) or []
+def _get_active_peers(relation):
+    """Return the names of the active peer units.
 
-
-def _relation_ids(reltype):
-    """List of relation_ids."""
-    relid_cmd_line = ['relation-ids', '--format=json', reltype]
-    return json.loads(
-        subprocess.check_output(relid_cmd_line).decode('UTF-8')) or []
-
-
-def _get_active_peers():
-    """Return the active_units."""
-    active_units = []
-    for rel_id in _relation_ids('slurmctld-peer'):
-        for unit in _related_units(rel_id):
-            active_units.append(unit)
-    return active_units
+    The units are read from the ops model rather than by forking
+    relation-ids/relation-list, and sorted to give a stable order.
+    """
+    return sorted(unit.name for unit in relation.units)
@@ -1,10 +1,20 @@
 #!/usr/bin/python3
 """SlurmdCharm."""
-import copy
+import json
 import logging
-
+import subprocess
+from datetime import datetime
+
+from config_render import (
+    get_changed_keys,
+    get_config_hashes,
+    render_config,
+    RESTARTED,
+)
+from hook_profiler import HookProfiler
 from interface_slurmd import Slurmd
 from interface_slurmd_peer import SlurmdPeer
+from inventory import PartitionRecord
 from nrpe_external_master import Nrpe
 from ops.charm import CharmBase
 from ops.framework import StoredState
@@ -12,13 +22,45 @@ from ops.main import main
 from ops.model import (
     ActiveStatus,
     BlockedStatus,
+    WaitingStatus,
 )
+from partition_files import include_partition_files
+from probe import ProbeError
 from slurm_ops_manager import SlurmManager
-from utils import random_string
+from utils import (
+    apply_node_states,
+    format_node_states,
+    get_slurmd_info_version,
+    node_is_busy,
+    NODE_STATES,
+    parse_legacy_node_states,
+    parse_node_states,
+    random_string,
+    reserve_system_resources,
+    RESUME,
+    SCONTROL_NODE_STATES,
+    scontrol_update_node_states,
+    slurmd_registered,
+    update_node_states,
+)
 
 
 logger = logging.getLogger()
 
+# slurm_config keys that slurmd picks up when it is sent a SIGHUP, a change
+# to any other key (including the node definitions) is a restart.
+RECONFIGURABLE_KEYS = frozenset({
+    'compress_node_names',
+    'nhc',
+    'node_weight_criteria',
+    'partitions',
+    'profiling',
+})
+
+# Seconds a restarted slurmd has to register with slurmctld before its
+# restart slot is handed on regardless.
+REGISTRATION_TIMEOUT = 120
+
 
 class SlurmdCharm(CharmBase):
     """Slurmd lifecycle events."""
@@ -29,10 +71,17 @@ class SlurmdCharm(CharmBase):
         """Init _stored attributes and interfaces, observe events."""
         super().__init__(*args)
 
+        self._profiler = HookProfiler(self, "hook-profiler")
+
         self._stored.set_default(
-            user_node_state=str(),
+            config_hashes=dict(),
+            node_states=dict(),
             partition_name=str(),
             config_available=False,
+            slurm_config_version=str(),
+            restart_deferred_at=str(),
+            restarted_at=str(),
+            user_node_state=str(),
         )
 
         self._nrpe = Nrpe(self, "nrpe-external-master")
@@ -45,6 +94,7 @@ class SlurmdCharm(CharmBase):
         event_handler_bindings = {
             self.on.install: self._on_install,
             self.on.upgrade_charm: self._on_upgrade,
+            self.on.update_status: self._on_update_status,
 
             self.on.config_changed:
             self._on_send_slurmd_info,
@@ -55,11 +105,20 @@ class SlurmdCharm(CharmBase):
             self._slurmd.on.slurm_config_available:
             self._on_check_status_and_write_config,
 
+            self._slurmd_peer.on.restart_granted:
+            self._on_restart_granted,
+
+            self.on.slurmd_peer_relation_changed:
+            self._on_slurmd_peer_relation_changed,
+
             self.on.set_node_state_action:
             self._on_set_node_state_action,
+
+            self.on.refresh_inventory_action:
+            self._on_refresh_inventory_action,
         }
         for event, handler in event_handler_bindings.items():
-            self.framework.observe(event, handler)
+            self.framework.observe(event, self._profiler.instrument(handler))
 
     def _on_config_changed(self, event):
         self.get_set_return_partition_name()
@@ -73,30 +132,339 @@ class SlurmdCharm(CharmBase):
     def _on_upgrade(self, event):
         self._slurm_manager.upgrade()
 
+        # Node states used to be stored as the raw action parameter.
+        if self._stored.user_node_state:
+            self._stored.node_states = \
+                parse_legacy_node_states(self._stored.user_node_state)
+            self._stored.user_node_state = str()
+
+    def _on_update_status(self, event):
+        """Finish pending restarts and refresh the inventory.
+
+        A restart held back while jobs were running is retried, and the slot
+        of a finished restart is freed. The inventory is republished if the
+        hardware changed since the probe: DIMM swaps, GPU hot-adds or cpus
+        going offline would otherwise leave slurm.conf with a stale
+        RealMemory or CPUs until the next reboot.
+        """
+        if self._stored.restart_deferred_at and self._check_status():
+            self._write_config()
+        self._check_registration()
+
+        interval = self.model.config.get('inventory-refresh-interval')
+        if not (interval and self._slurmd_peer.is_joined):
+            return
+        try:
+            inventory = self._slurmd_peer.refresh_inventory(interval)
+        except ProbeError as e:
+            logger.warning(f"Unable to probe node hardware: {e}")
+            return
+        # Changing our own unit data does not trigger a relation-changed
+        # on this unit, so the leader has to re-assemble the partition here.
+        if inventory and self.framework.model.unit.is_leader():
+            self._slurmd_peer.on.slurmd_peer_available.emit()
+
     def _on_set_node_state_action(self, event):
-        """Set the node state."""
-        self._stored.user_node_state = event.params["node-state"]
-        self._on_send_slurm_info(event)
+        """Set or clear (RESUME) node state overrides.
+
+        The overrides are kept as a node_name: state mapping, parsed and
+        expanded once here, so assembling the partition only looks them up.
+        """
+        try:
+            updates = parse_node_states(event.params["node-state"])
+        except ValueError as e:
+            event.fail(f"Invalid node-state: {e}")
+            return
+
+        scontrol = self.model.config.get('node-state-scontrol')
+        valid_states = SCONTROL_NODE_STATES if scontrol else NODE_STATES
+        invalid = set(updates.values()) - valid_states - {RESUME}
+        if invalid:
+            event.fail(f"Invalid node state(s): {', '.join(sorted(invalid))}")
+            return
+
+        if scontrol:
+            self._set_node_states_with_scontrol(event, updates)
+            return
+
+        node_states = self._update_node_states(updates)
+        results = {'node-states': format_node_states(node_states)}
+        # Action events can not be deferred, the node states go out with
+        # the next partition the leader publishes instead.
+        if self.framework.model.unit.is_leader() and \
+                not self._publish_slurmd_info():
+            results['message'] = "slurmd relation not available yet, the " \
+                "node states are published once it is."
+        event.set_results(results)
+
+    def _set_node_states_with_scontrol(self, event, updates):
+        """Apply the node states on slurmctld and record them as desired.
+
+        Only slurmctld is touched, the slurm_config is left as it is. The
+        next partition the leader assembles carries the desired states, so
+        that a controller that loses its state converges on them.
+        """
+        if not self.framework.model.unit.is_leader():
+            event.fail("Run set-node-state on the leader unit.")
+            return
+        if not self._slurmd_peer.is_joined:
+            event.fail("slurmd-peer relation not available yet.")
+            return
+
+        # The states slurmctld took before an update failed are recorded
+        # all the same, they are in effect.
+        applied, error = scontrol_update_node_states(
+            updates,
+            event.params["reason"],
+        )
+        node_states = self._update_node_states(applied, desired=True)
+        if error:
+            event.fail(f"scontrol update failed: {error}")
+            return
+        event.set_results({'node-states': format_node_states(node_states)})
+
+    def _update_node_states(self, updates, desired=False):
+        """Record the node state updates and return all the overrides.
+
+        The states set through scontrol are recorded as desired states in
+        the peer app data, the others in the stored node_states. A node set
+        in one is dropped from the other, so that RESUME, or a new state,
+        is never undone by what the other still holds.
+        """
+        resumed = {node_name: RESUME for node_name in updates}
+        node_states = update_node_states(
+            self._stored.node_states,
+            resumed if desired else updates,
+        )
+        self._stored.node_states = node_states
+
+        desired_node_states = self._slurmd_peer.get_desired_node_states()
+        if self.framework.model.unit.is_leader() and \
+                self._slurmd_peer.is_joined:
+            desired_node_states = update_node_states(
+                desired_node_states,
+                updates if desired else resumed,
+            )
+            self._slurmd_peer.set_desired_node_states(desired_node_states)
+        return {**node_states, **desired_node_states}
+
+    def _on_refresh_inventory_action(self, event):
+        """Probe the hardware again and publish the new inventory."""
+        if not self._slurmd_peer.is_joined:
+            event.fail("slurmd-peer relation not available yet.")
+            return
+        try:
+            inventory = \
+                self._slurmd_peer.set_inventory_on_unit_relation_data(
+                    refresh=True,
+                )
+        except ProbeError as e:
+            event.fail(f"Unable to probe node hardware: {e}")
+            return
+        # Changing our own unit data does not trigger a relation-changed
+        # on this unit, so the leader has to re-assemble the partition here.
+        if self.framework.model.unit.is_leader():
+            self._slurmd_peer.on.slurmd_peer_available.emit()
+        event.set_results({'inventory': json.dumps(inventory.to_dict())})
 
     def _on_send_slurmd_info(self, event):
         if self.framework.model.unit.is_leader():
-            if self._slurmd.is_joined:
-                partition = self._assemble_partition()
-                if partition:
-                    self._slurmd.set_slurmd_info_on_app_relation_data(
-                        partition
-                    )
-                    return
-            event.defer()
-            return
+            if not self._publish_slurmd_info():
+                event.defer()
+
+    def _publish_slurmd_info(self):
+        """Publish the partition on the slurmd relation.
+
+        Returns False if the relation or the partition is not available yet.
+        """
+        if not self._slurmd.is_joined:
+            return False
+        partition = self._assemble_partition()
+        if not partition:
+            return False
+        slurmd_info = partition.to_dict()
+        # Relations that already hold this version of the partition are not
+        # written to again.
+        slurmd_info_version = get_slurmd_info_version(slurmd_info)
+        self._slurmd.set_slurmd_info_on_app_relation_data(
+            slurmd_info,
+            slurmd_info_version,
+        )
+        return True
 
     def _on_check_status_and_write_config(self, event):
         if not self._check_status():
             event.defer()
             return
+        self._write_config()
+
+    def _write_config(self):
+        """Render the slurm_config, restarting slurmd in a batch if needed."""
         slurm_config = dict(self._slurmd.get_slurm_config())
-        self._slurm_manager.render_config_and_restart(slurm_config)
-        self.unit.status = ActiveStatus("Slurmd Available")
+        slurm_config_version = self._slurmd.get_slurm_config_version()
+
+        # In configless mode the slurm_config only carries the munge key and
+        # the controller addresses, slurmd is started with --conf-server
+        # and fetches the rest of its configuration from slurmctld. The full
+        # slurm_config carries the 'configless' flag of slurmctld too, so
+        # configless slurmd is told apart by its conf_server.
+        if slurm_config.get('conf_server'):
+            logger.debug(f"configless, conf_server: "
+                         f"{slurm_config['conf_server']}")
+
+        config_hashes = get_config_hashes(slurm_config)
+        changed_keys = get_changed_keys(
+            self._stored.config_hashes,
+            config_hashes,
+        )
+
+        # A restart makes slurmd re-register with slurmctld. Rather than
+        # have every unit do so at once, restarts are rolled out in batches
+        # handed out by the leader. What slurmd can pick up without a
+        # restart is applied right away, nodes running jobs hold back the
+        # restart itself, update-status tries again.
+        if changed_keys and not changed_keys <= RECONFIGURABLE_KEYS and \
+                self._slurmd_peer.is_joined:
+            self._reconfigure_before_restart(
+                slurm_config,
+                config_hashes,
+                changed_keys,
+            )
+            if self._restart_deferred():
+                logger.info("jobs running, restart deferred for: "
+                            f"{sorted(changed_keys)}")
+                self.unit.status = WaitingStatus("Jobs running, restart "
+                                                 "deferred")
+            else:
+                self.unit.status = WaitingStatus("Waiting for restart slot")
+                self._slurmd_peer.request_restart(slurm_config_version)
+            return
+        self._stored.restart_deferred_at = str()
+
+        action = render_config(
+            self._slurm_manager,
+            slurm_config,
+            changed_keys,
+            RECONFIGURABLE_KEYS,
+            self._reconfigure,
+            self._get_render_context,
+        )
+        self._stored.config_hashes = config_hashes
+        self._stored.slurm_config_version = slurm_config_version
+        self.unit.status = ActiveStatus(f"Slurmd Available ({action})")
+
+    def _reconfigure_before_restart(self, slurm_config, config_hashes,
+                                    changed_keys):
+        """Write the config files and apply what slurmd can without restart.
+
+        The hashes of the keys applied are stored, the others are left for
+        the restart to pick up.
+        """
+        reconfigurable_keys = changed_keys & RECONFIGURABLE_KEYS
+        render_slurm_configs = getattr(
+            self._slurm_manager, 'render_slurm_configs', None
+        )
+        if not (reconfigurable_keys and render_slurm_configs):
+            return
+
+        render_slurm_configs(self._get_render_context(slurm_config))
+        try:
+            self._reconfigure()
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error(f"reconfigure failed, left to the restart: {e}")
+            return
+
+        stored_hashes = dict(self._stored.config_hashes)
+        for key in reconfigurable_keys:
+            if key in config_hashes:
+                stored_hashes[key] = config_hashes[key]
+            else:
+                stored_hashes.pop(key, None)
+        self._stored.config_hashes = stored_hashes
+
+    def _restart_deferred(self):
+        """Return True if the restart waits for the running jobs to finish.
+
+        A node that is never idle restarts anyway after restart-max-deferral
+        seconds.
+        """
+        if not node_is_busy(self.get_hostname()):
+            self._stored.restart_deferred_at = str()
+            return False
+
+        now = datetime.now().replace(microsecond=0)
+        if not self._stored.restart_deferred_at:
+            self._stored.restart_deferred_at = now.isoformat()
+        deferred_at = datetime.fromisoformat(self._stored.restart_deferred_at)
+        max_deferral = self.model.config.get('restart-max-deferral')
+        if max_deferral and \
+                (now - deferred_at).total_seconds() >= max_deferral:
+            logger.warning("jobs still running after restart-max-deferral, "
+                           "restarting anyway.")
+            self._stored.restart_deferred_at = str()
+            return False
+        return True
+
+    def _on_restart_granted(self, event):
+        """Restart slurmd, the slot is kept until it has registered."""
+        # The grant stands until the restart is reported done, a restart
+        # waiting for registration is not run again.
+        if self._stored.restarted_at:
+            return
+        slurm_config = self._slurmd.get_slurm_config()
+        if not slurm_config:
+            self._slurmd_peer.restart_done()
+            return
+        config_hashes = get_config_hashes(slurm_config)
+
+        self._stored.restarted_at = \
+            datetime.now().replace(microsecond=0).isoformat()
+        self._slurm_manager.render_config_and_restart(
+            self._get_render_context(slurm_config)
+        )
+        self._stored.config_hashes = config_hashes
+        self._stored.slurm_config_version = \
+            self._slurmd.get_slurm_config_version()
+        self.unit.status = WaitingStatus("Waiting for slurmd to register")
+
+    def _on_slurmd_peer_relation_changed(self, event):
+        self._check_registration()
+
+    def _check_registration(self):
+        """Report the restart done once slurmd has registered.
+
+        Runs from the update-status and slurmd-peer hooks that follow the
+        restart, rather than blocking the restart hook, so the slot is held
+        at least until the next of them. A node that does not come back
+        within REGISTRATION_TIMEOUT must not hold up the rest of the
+        rollout, its slot is freed either way.
+        """
+        if not self._stored.restarted_at:
+            return
+        restarted_at = datetime.fromisoformat(self._stored.restarted_at)
+        if not slurmd_registered(self.get_hostname(), restarted_at):
+            waited = (datetime.now() - restarted_at).total_seconds()
+            if waited < REGISTRATION_TIMEOUT:
+                return
+            logger.warning("slurmd did not register after the restart.")
+
+        self._stored.restarted_at = str()
+        self.unit.status = ActiveStatus(f"Slurmd Available ({RESTARTED})")
+        self._slurmd_peer.restart_done(self._stored.slurm_config_version)
+
+    def _get_render_context(self, slurm_config):
+        """Return slurm_config with the partitions moved to include files.
+
+        In configless mode slurmd fetches the include files from slurmctld
+        along with slurm.conf, there is nothing to write.
+        """
+        if slurm_config.get('conf_server'):
+            return slurm_config
+        return include_partition_files(slurm_config)
+
+    def _reconfigure(self):
+        """Make the local slurmd re-read slurm.conf."""
+        subprocess.check_call(["pkill", "--signal", "HUP", "-x", "slurmd"])
 
     def _check_status(self):
         slurm_installed = self._stored.slurm_installed
@@ -111,19 +479,17 @@ class SlurmdCharm(CharmBase):
             return True
 
     def _assemble_partition(self):
-        """Assemble the partition info."""
-        partition_name = self._stored.partition_name
-        partition_config = self.model.config.get('partition-config')
-        partition_state = self.model.config.get('partition-state')
-
+        """Assemble the PartitionRecord, None if there are no nodes yet."""
         slurmd_info = self._assemble_slurmd_info()
+        if not slurmd_info:
+            return None
 
-        return {
-            'inventory': slurmd_info,
-            'partition_name': partition_name,
-            'partition_state': partition_state,
-            'partition_config': partition_config,
-        }
+        return PartitionRecord(
+            self.get_set_return_partition_name(),
+            slurmd_info,
+            self.model.config.get('partition-state'),
+            self.model.config.get('partition-config'),
+        )
 
     def _assemble_slurmd_info(self):
         """Apply mutations to nodes in the partition, return slurmd nodes."""
@@ -131,36 +497,28 @@ class SlurmdCharm(CharmBase):
         if not slurmd_info:
             return None
 
+        # Keep the cores and memory slurmd, munged and the OS need out of
+        # reach of jobs. The reservation is applied here on the leader so
+        # that changing it does not make every unit republish.
+        slurmd_info = reserve_system_resources(
+            slurmd_info,
+            self.model.config.get('reserved-cores'),
+            self.model.config.get('reserved-memory'),
+            self.model.config.get('reserved-cores-pinned'),
+        )
+
         # If the user has set custom state for nodes
-        # ensure we update the state for the targeted nodes.
-        user_node_state = self._stored.user_node_state
-        if user_node_state:
-            node_states = {
-                item.split("=")[0]: item.split("=")[1]
-                for item in user_node_state.split(",")
-            }
-
-            # Copy the slurmd_info returned from the the slurmd-peer relation
-            # to a temporary variable to which we will make modifications.
-            slurmd_info_tmp = copy.deepcopy(slurmd_info)
-
-            # Iterate over the slurmd nodes in the partition and check
-            # for nodes that need their state modified.
-            for partition in slurmd_info:
-                partition_tmp = copy.deepcopy(partition)
-                for slurmd_node in partition['inventory']:
-                    if slurmd_node['hostname'] in node_states.keys():
-                        slurmd_node_tmp = copy.deepcopy(slurmd_node)
-                        slurmd_node_tmp['state'] = \
-                            node_states[slurmd_node['hostname']]
-                        partition_tmp['inventory'].remove(slurmd_node)
-                        partition_tmp['inventory'].append(slurmd_node_tmp)
-                slurmd_info_tmp.remove(partition)
-                slurmd_info_tmp.append(partition_tmp)
-        else:
-            slurmd_info_tmp = slurmd_info
+        # ensure we update the state for the targeted nodes. States applied
+        # through scontrol take precedence.
+        node_states = {
+            **self._stored.node_states,
+            **self._slurmd_peer.get_desired_node_states(),
+        }
+        return apply_node_states(slurmd_info, node_states)
 
-        return slurmd_info_tmp
+    def get_slurm_config_version(self):
+        """Return the version of the last rendered slurm_config."""
+        return self._stored.slurm_config_version
 
     def get_set_return_partition_name(self):
         """Set the partition name."""
@@ -183,6 +541,12 @@ class SlurmdCharm(CharmBase):
         """Return the hostname."""
         return self._slurm_manager.hostname
 
+    def supports_configless(self):
+        """Return True if slurm-ops-manager can run slurm configless."""
+        return bool(
+            getattr(self._slurm_manager, 'supports_configless', False)
+        )
+
     def get_port(self):
         """Return the port."""
         return self._slurm_manager.port
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+"""The slurm_config, split into independently versioned sections.
+
+Instead of a single 'slurm_config' key, the configurator can publish the
+slurm_config as one app data key per section:
+
+    slurm_config.core                  munge key, controllers, charm config
+    slurm_config.accounting            slurmdbd
+    slurm_config.addons                influxdb, elasticsearch, nhc
+    slurm_config.partitions.<name>     one per partition
+
+along with 'slurm_config.sections', a json index mapping each section to
+the hash of its value. Only the sections whose hash changed are set again,
+so a node joining one partition only rewrites the key of that partition.
+
+Sections are only sent to applications that advertise SECTIONS_FEATURE in
+their 'payload_features', the others get the merged 'slurm_config'.
+"""
+import hashlib
+import json
+import logging
+
+from payload import (
+    decode,
+    encode,
+    supports_envelope,
+    supports_feature,
+)
+
+
+logger = logging.getLogger()
+
+
+SECTIONS_FEATURE = "slurm-config-sections/1"
+# Advertised by slurmctld and slurmd when their slurm-ops-manager can run
+# slurm configless: slurmctld with enable_configless, slurmd with
+# --conf-server.
+CONFIGLESS_FEATURE = "slurm-configless/1"
+SECTIONS_KEY = 'slurm_config.sections'
+SECTION_PREFIX = 'slurm_config.'
+PARTITION_PREFIX = 'partitions.'
+
+
+def get_section_hashes(sections):
+    """Return a canonical hash of each section."""
+    return {
+        section: hashlib.sha256(
+            json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+        for section, value in sections.items()
+    }
+
+
+def merge_sections(sections):
+    """Return the slurm_config the sections were split from."""
+    slurm_config = dict()
+    partitions = []
+    for section, value in sections.items():
+        if section.startswith(PARTITION_PREFIX):
+            partitions.append(value)
+        else:
+            slurm_config.update(value)
+    if partitions:
+        slurm_config['partitions'] = partitions
+    return slurm_config
+
+
+def _get_section_index(app_data):
+    """Return the section index set in app_data."""
+    index = app_data.get(SECTIONS_KEY)
+    return json.loads(index) if index else dict()
+
+
+def set_slurm_config_on_relation(relation, app, sections, section_hashes,
+                                 slurm_config_version, payloads):
+    """Set the slurm_config sections on the app data of relation.
+
+    The sections are set the way the remote application can read them,
+    either one key per changed section or the merged slurm_config. payloads
+    caches the encoded values so that each is only encoded once across
+    relations. Passing no sections clears the slurm_config.
+    """
+    app_relation_data = relation.data[app]
+    if sections and app_relation_data.get('slurm_config_version') == \
+            slurm_config_version:
+        return
+
+    previous_hashes = _get_section_index(app_relation_data)
+    envelope = supports_envelope(relation)
+
+    if sections and supports_feature(relation, SECTIONS_FEATURE):
+        changed = [
+            section for section, section_hash in section_hashes.items()
+            if previous_hashes.get(section) != section_hash
+        ]
+        for section in changed:
+            if (section, envelope) not in payloads:
+                payloads[(section, envelope)] = encode(
+                    sections[section],
+                    envelope,
+                    f"{SECTION_PREFIX}{section}",
+                )
+            app_relation_data[f"{SECTION_PREFIX}{section}"] = \
+                payloads[(section, envelope)]
+        removed = previous_hashes.keys() - section_hashes.keys()
+        logger.debug(f"slurm_config sections changed: {changed}, "
+                     f"removed: {sorted(removed)}")
+        app_relation_data[SECTIONS_KEY] = json.dumps(section_hashes)
+        slurm_config = ""
+    else:
+        removed = previous_hashes.keys()
+        if sections:
+            if ('slurm_config', envelope) not in payloads:
+                payloads[('slurm_config', envelope)] = encode(
+                    merge_sections(sections),
+                    envelope,
+                    'slurm_config',
+                )
+            slurm_config = payloads[('slurm_config', envelope)]
+        else:
+            slurm_config = ""
+        if previous_hashes:
+            app_relation_data[SECTIONS_KEY] = ""
+
+    # Setting a key to "" removes it from the relation data.
+    for section in removed:
+        app_relation_data[f"{SECTION_PREFIX}{section}"] = ""
+    if app_relation_data.get('slurm_config', "") != slurm_config:
+        app_relation_data['slurm_config'] = slurm_config
+    app_relation_data['slurm_config_version'] = slurm_config_version
+
+
+def has_slurm_config(app_data):
+    """Return True if app_data holds a slurm_config in either form."""
+    return bool(app_data.get(SECTIONS_KEY) or app_data.get('slurm_config'))
+
+
+def get_slurm_config_from_app_data(app_data):
+    """Return the slurm_config set in app_data in either form, or None."""
+    section_hashes = _get_section_index(app_data)
+    if not section_hashes:
+        slurm_config = app_data.get('slurm_config')
+        return decode(slurm_config, 'slurm_config') if slurm_config else None
+
+    return merge_sections({
+        section: decode(
+            app_data[f"{SECTION_PREFIX}{section}"],
+            f"{SECTION_PREFIX}{section}",
+        )
+        for section in section_hashes.keys()
+    })
@@ -1,13 +1,31 @@
 #!/usr/bin/python3
 """Slurmd."""
-import json
+import logging
 
+from config_sections import (
+    CONFIGLESS_FEATURE,
+    get_slurm_config_from_app_data,
+    has_slurm_config,
+    SECTIONS_FEATURE,
+)
 from ops.framework import (
     EventBase,
     EventSource,
     Object,
     ObjectEvents,
 )
+from payload import (
+    advertise_features,
+    encode,
+    FEATURES,
+    supports_envelope,
+)
+
+
+logger = logging.getLogger()
+
+# The configurator may send us the slurm_config in sections.
+PAYLOAD_FEATURES = (*FEATURES, SECTIONS_FEATURE)
 
 
 class SlurmConfigAvailableEvent(EventBase):
@@ -46,6 +64,11 @@ class Slurmd(Object):
         if self.framework.model.unit.is_leader():
             event.relation.data[self.model.app]['partition_name'] = \
                 self._charm.get_set_return_partition_name()
+            advertise_features(
+                event.relation,
+                self.model.app,
+                self._payload_features,
+            )
 
     def _on_relation_changed(self, event):
         """Check for the munge_key in the relation data."""
@@ -53,15 +76,28 @@ class Slurmd(Object):
         if not event_app_data:
             event.defer()
             return
-        slurm_config = event_app_data.get('slurm_config')
-        
-        if not slurm_config:
+        if not has_slurm_config(event_app_data):
             event.defer()
             return
 
         self._charm._stored.config_available = True
+
+        # The configurator publishes a version alongside the slurm_config,
+        # if we have already rendered this version there is nothing to do.
+        slurm_config_version = event_app_data.get('slurm_config_version')
+        if slurm_config_version and \
+                slurm_config_version == self._charm.get_slurm_config_version():
+            logger.debug(f"slurm_config {slurm_config_version} unchanged.")
+            return
         self.on.slurm_config_available.emit()
 
+    @property
+    def _payload_features(self):
+        """Return the features we advertise, configless if we can run it."""
+        if self._charm.supports_configless():
+            return (*PAYLOAD_FEATURES, CONFIGLESS_FEATURE)
+        return PAYLOAD_FEATURES
+
     @property
     def _relation(self):
         return self.framework.model.get_relation(self._relation_name)
@@ -71,18 +107,36 @@ class Slurmd(Object):
         """Return True if relation is joined."""
         return self._relation is not None
 
-    def set_slurmd_info_on_app_relation_data(self, slurmd_info):
+    def set_slurmd_info_on_app_relation_data(
+        self,
+        slurmd_info,
+        slurmd_info_version=str(),
+    ):
         """Set the slurmd_info on the app relation data.
 
         Setting data on the application relation forces the units of related
         slurm-configurator application(s) to observe the relation-changed
         event so they can acquire and redistribute the updated slurm config.
+
+        Relations that already hold slurmd_info_version are left untouched.
         """
         relations = self._charm.framework.model.relations['slurmd']
         for relation in relations:
-            relation.data[self.model.app]['slurmd_info'] = json.dumps(
-                slurmd_info
+            app_relation_data = relation.data[self.model.app]
+            advertise_features(
+                relation,
+                self.model.app,
+                self._payload_features,
+            )
+            if app_relation_data.get('slurmd_info_version') == \
+                    slurmd_info_version and slurmd_info_version:
+                continue
+            app_relation_data['slurmd_info'] = encode(
+                slurmd_info,
+                supports_envelope(relation),
+                'slurmd_info',
             )
+            app_relation_data['slurmd_info_version'] = slurmd_info_version
 
     def get_slurm_config(self):
         """Return slurm_config."""
@@ -92,7 +146,16 @@ class Slurmd(Object):
             if app:
                 app_data = self._relation.data.get(app)
                 if app_data:
-                    slurm_config = app_data.get('slurm_config')
-                    if slurm_config:
-                        return json.loads(slurm_config)
+                    return get_slurm_config_from_app_data(app_data)
         return None
+
+    def get_slurm_config_version(self):
+        """Return slurm_config_version."""
+        relation = self._relation
+        if relation:
+            app = relation.app
+            if app:
+                app_data = self._relation.data.get(app)
+                if app_data:
+                    return app_data.get('slurm_config_version', str())
+        return str()
@@ -2,15 +2,26 @@
 """SlurmdPeer."""
 import json
 import logging
+import time
 
 
+from inventory import InventoryError, NodeRecord
 from ops.framework import (
     EventBase,
     EventSource,
     Object,
     ObjectEvents,
+    StoredState,
+)
+from ops.model import BlockedStatus
+from probe import ProbeError
+from utils import (
+    format_node_states,
+    get_hardware_inventory,
+    get_inventory,
+    parse_node_states,
+    write_hardware_inventory_cache,
 )
-from utils import get_active_units, get_inventory
 
 
 logger = logging.getLogger()
@@ -20,16 +31,22 @@ class SlurmdPeerAvailableEvent(EventBase):
     """Emmited on the relation_changed event."""
 
 
+class RestartGrantedEvent(EventBase):
+    """Emitted when the leader grants this unit a restart slot."""
+
+
 class PeerRelationEvents(ObjectEvents):
     """Peer Relation Events."""
 
     slurmd_peer_available = EventSource(SlurmdPeerAvailableEvent)
+    restart_granted = EventSource(RestartGrantedEvent)
 
 
 class SlurmdPeer(Object):
     """TestingPeerRelation."""
 
     on = PeerRelationEvents()
+    _stored = StoredState()
 
     def __init__(self, charm, relation_name):
         """Initialize charm attributes."""
@@ -37,6 +54,8 @@ class SlurmdPeer(Object):
         self._charm = charm
         self._relation_name = relation_name
 
+        self._stored.set_default(inventory_published_at=0.0)
+
         self.framework.observe(
             self._charm.on[self._relation_name].relation_created,
             self._on_relation_created
@@ -47,38 +66,227 @@ class SlurmdPeer(Object):
             self._on_relation_changed
         )
 
+        self.framework.observe(
+            self._charm.on[self._relation_name].relation_departed,
+            self._on_relation_departed
+        )
+
     def _on_relation_created(self, event):
         """Set our inventory on unit data."""
-        node_name = self._charm.get_hostname()
-        node_addr = event.relation.data[self.model.unit]['ingress-address']
-
-        event.relation.data[self.model.unit]['inventory'] = json.dumps(
-            get_inventory(node_name, node_addr)
-        )
+        try:
+            self.set_inventory_on_unit_relation_data()
+        except ProbeError as e:
+            logger.error(e)
+            self._charm.unit.status = BlockedStatus(
+                "Unable to probe node hardware."
+            )
+            event.defer()
+            return
         if self.framework.model.unit.is_leader():
             self.on.slurmd_peer_available.emit()
 
     def _on_relation_changed(self, event):
         if self.framework.model.unit.is_leader():
             self.on.slurmd_peer_available.emit()
+            self._update_restart_grants()
+        self._check_restart_grant()
+
+    def _on_relation_departed(self, event):
+        """Hand the slot of a departed unit to the next one."""
+        if self.framework.model.unit.is_leader():
+            self._update_restart_grants()
+
+    @property
+    def _relation(self):
+        return self.framework.model.get_relation(self._relation_name)
+
+    @property
+    def is_joined(self):
+        """Return True if relation is joined."""
+        return self._relation is not None
+
+    @property
+    def _inventory_cache_file(self):
+        return self._charm.charm_dir / ".inventory.json"
+
+    def set_inventory_on_unit_relation_data(self, refresh=False,
+                                            inventory=None):
+        """Set our inventory on the unit relation data and return it.
+
+        The hardware inventory is cached in the charm dir and only probed
+        again after a reboot or when refresh is True. An inventory the
+        caller has just probed is published as is.
+        """
+        relation = self._relation
+        unit_relation_data = relation.data[self.model.unit]
+
+        if inventory is None:
+            inventory = get_inventory(
+                self._charm.get_hostname(),
+                unit_relation_data['ingress-address'],
+                cache_file=self._inventory_cache_file,
+                refresh=refresh,
+            )
+        unit_relation_data['inventory'] = json.dumps(inventory.to_dict())
+        self._stored.inventory_published_at = time.time()
+        return inventory
+
+    def refresh_inventory(self, min_interval):
+        """Probe the hardware, republish the inventory if it changed.
+
+        The probed inventory is compared with the published one, nothing is
+        written when they match. A changed inventory is republished at most
+        once every min_interval seconds, so that a flapping device can not
+        set off a slurm_config change on every update-status. Returns the
+        republished inventory, or None.
+        """
+        unit_relation_data = self._relation.data[self.model.unit]
+        hardware_inventory = get_hardware_inventory()
+        inventory = NodeRecord(
+            self._charm.get_hostname(),
+            unit_relation_data['ingress-address'],
+            **hardware_inventory,
+        )
+        if json.dumps(inventory.to_dict()) == \
+                unit_relation_data.get('inventory'):
+            return None
+
+        elapsed = time.time() - self._stored.inventory_published_at
+        if elapsed < min_interval:
+            logger.info("Hardware inventory changed, republishing held back "
+                        f"for {min_interval - elapsed:.0f}s.")
+            return None
+
+        logger.info(f"Hardware inventory changed: {inventory}")
+        # The cache is brought up to date with the probe, so that the next
+        # hook that reads it does not probe again.
+        write_hardware_inventory_cache(
+            self._inventory_cache_file,
+            hardware_inventory,
+        )
+        return self.set_inventory_on_unit_relation_data(inventory=inventory)
 
     def get_slurmd_info(self):
-        """Return slurmd inventory."""
-        relation = self.framework.model.get_relation(self._relation_name)
+        """Return the NodeRecord of each unit."""
+        relation = self._relation
 
         # Comprise slurmd_info with the inventory of the active slurmd_peers
-        # plus our own inventory.
-        slurmd_peers = get_active_units(self._relation_name)
-        peers = relation.units
+        # plus our own inventory. Peers that have not published their
+        # inventory yet are skipped, they will trigger a relation-changed
+        # once they do.
+        slurmd_info = []
+        # Order the units by unit number, relation.units is a set and an
+        # unstable order would change the hash of an unchanged partition.
+        units = sorted(
+            [*relation.units, self.model.unit],
+            key=lambda unit: int(unit.name.split("/")[1]),
+        )
+        for unit in units:
+            inventory = relation.data[unit].get('inventory')
+            if not inventory:
+                continue
 
-        slurmd_info = [
-            json.loads(relation.data[peer]['inventory'])
-            for peer in peers if peer.name in slurmd_peers
-        ]
+            # A unit publishing an invalid inventory is left out of the
+            # partition rather than failing the hook of the leader.
+            try:
+                slurmd_info.append(NodeRecord.from_dict(json.loads(inventory)))
+            except InventoryError as e:
+                logger.error(f"{unit.name}: {e}")
+
+        return slurmd_info
+
+    def get_desired_node_states(self):
+        """Return the node states applied through scontrol.
+
+        The states are recorded by the leader in the app data, as a
+        node_name: state mapping in the set-node-state format.
+        """
+        relation = self._relation
+        if not relation:
+            return dict()
+        node_states = relation.data[self.model.app].get('node_states')
+        return parse_node_states(node_states) if node_states else dict()
+
+    def set_desired_node_states(self, node_states):
+        """Record the node_name: state mapping in the app data."""
+        self._relation.data[self.model.app]['node_states'] = \
+            format_node_states(node_states)
+
+    def request_restart(self, slurm_config_version):
+        """Ask the leader for a slot to restart with slurm_config_version.
+
+        The leader hands out the slots, at most restart-batch-size at a time,
+        and a slot is freed once its unit reports the restart as done.
+        """
+        unit_relation_data = self._relation.data[self.model.unit]
+        unit_relation_data['restart_request'] = slurm_config_version
+        if self.framework.model.unit.is_leader():
+            self._update_restart_grants()
+        self._check_restart_grant()
 
-        # Add our own inventory to the slurmd_info
-        slurmd_info.append(
-            json.loads(relation.data[self.model.unit]['inventory'])
+    def restart_done(self, slurm_config_version=None):
+        """Report the restart for slurm_config_version as done.
+
+        The slot is freed, unless a restart for a newer slurm_config_version
+        has been requested since, which then runs in the same slot.
+        slurm_config_version defaults to the requested one.
+        """
+        if not self.is_joined:
+            return
+        unit_relation_data = self._relation.data[self.model.unit]
+        unit_relation_data['restart_done'] = slurm_config_version or \
+            unit_relation_data.get('restart_request', str())
+        if self.framework.model.unit.is_leader():
+            self._update_restart_grants()
+        self._check_restart_grant()
+
+    def _restart_pending(self, unit):
+        """Return True if unit has asked for a restart it has not done."""
+        unit_relation_data = self._relation.data[unit]
+        restart_request = unit_relation_data.get('restart_request')
+        return bool(restart_request) and \
+            restart_request != unit_relation_data.get('restart_done')
+
+    def _get_restart_grants(self):
+        """Return the names of the units allowed to restart."""
+        restart_grants = self._relation.data[self.model.app].get(
+            'restart_grants'
         )
+        return json.loads(restart_grants) if restart_grants else []
 
-        return slurmd_info
+    def _update_restart_grants(self):
+        """Free the slots of finished restarts and grant the next ones."""
+        relation = self._relation
+        batch_size = self.model.config.get('restart-batch-size')
+
+        units = sorted(
+            [*relation.units, self.model.unit],
+            key=lambda unit: int(unit.name.split("/")[1]),
+        )
+        pending = [unit.name for unit in units if self._restart_pending(unit)]
+
+        # Keep the slots that are still in use, departed units and finished
+        # restarts drop out here.
+        restart_grants = [
+            unit_name for unit_name in self._get_restart_grants()
+            if unit_name in pending
+        ]
+        for unit_name in pending:
+            if batch_size and len(restart_grants) >= batch_size:
+                break
+            if unit_name not in restart_grants:
+                restart_grants.append(unit_name)
+
+        if restart_grants != self._get_restart_grants():
+            logger.debug(f"restart grants: {restart_grants}, "
+                         f"{len(pending)} pending")
+            relation.data[self.model.app]['restart_grants'] = \
+                json.dumps(restart_grants)
+
+    def _check_restart_grant(self):
+        """Emit restart_granted if this unit holds a slot it has not used."""
+        if not self.is_joined:
+            return
+        if self._restart_pending(self.model.unit) and \
+                self.model.unit.name in self._get_restart_grants():
+            self.on.restart_granted.emit()
@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+"""Typed node and partition records.
+
+The inventory travels over the relations as json dicts. Once read off a
+relation it is held in records instead: the fields live in __slots__, the
+counts are validated and converted to ints once, so the records take less
+memory than the dicts and sort numerically without re-parsing.
+
+    NodeRecord.from_dict(node)          <- relation data
+    NodeRecord.to_dict()                -> relation data
+"""
+import logging
+
+
+logger = logging.getLogger()
+
+
+class InventoryError(ValueError):
+    """Raised when an inventory does not match the schema."""
+
+
+def _to_count(value, field):
+    """Return value as a count, accepting the strings older charms send."""
+    if value is None or value == "":
+        return 0
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        raise InventoryError(f"{field} is not a number: {value!r}")
+    if count < 0:
+        raise InventoryError(f"{field} is negative: {value!r}")
+    return count
+
+
+class GpuRecord:
+    """A gpu of a node and the slurm ids of the cores local to it."""
+
+    __slots__ = (
+        'pci_address',
+        'file',
+        'model',
+        'gres_type',
+        'numa_node',
+        'cores',
+    )
+
+    def __init__(self, pci_address, file, model="", gres_type="",
+                 numa_node=-1, cores=""):
+        """Validate and set the fields."""
+        if not file or not isinstance(file, str):
+            raise InventoryError(f"Invalid gpu file: {file!r}")
+        self.pci_address = pci_address
+        self.file = file
+        self.model = model
+        self.gres_type = gres_type
+        self.numa_node = int(numa_node)
+        self.cores = cores
+
+    @classmethod
+    def from_dict(cls, gpu):
+        """Return the record of a gpu dict read off a relation."""
+        try:
+            return cls(**{
+                field: value for field, value in gpu.items()
+                if field in cls.__slots__
+            })
+        except (TypeError, ValueError) as e:
+            raise InventoryError(f"Invalid gpu: {e}")
+
+    def to_dict(self):
+        """Return the gpu as a dict for relation data."""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def _key(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        """Return True if other is a record with the same fields."""
+        if not isinstance(other, GpuRecord):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        """Return the hash of the fields, gpus are part of hardware_key."""
+        return hash(self._key())
+
+
+class NodeRecord:
+    """The inventory of a single node."""
+
+    STR_FIELDS = ('node_name', 'node_addr', 'state', 'cpu_spec_list')
+    COUNT_FIELDS = (
+        'real_memory',
+        'cpus',
+        'sockets_per_board',
+        'cores_per_socket',
+        'threads_per_core',
+        'gres',
+        'weight',
+        'core_spec_count',
+        'mem_spec_limit',
+    )
+    # Fields left out of the dict when they are empty or 0.
+    OPTIONAL_FIELDS = frozenset({
+        'cpu_spec_list',
+        'gres',
+        'weight',
+        'core_spec_count',
+        'mem_spec_limit',
+        'gpus',
+    })
+
+    __slots__ = STR_FIELDS + COUNT_FIELDS + ('gpus',)
+
+    def __init__(self, node_name, node_addr, state="UNKNOWN",
+                 cpu_spec_list="", gpus=(), **counts):
+        """Validate and set the fields, counts default to 0.
+
+        gpus are GpuRecords or the dicts of them.
+        """
+        if not node_name or not isinstance(node_name, str):
+            raise InventoryError(f"Invalid node_name: {node_name!r}")
+        self.node_name = node_name
+        self.node_addr = node_addr
+        self.state = state
+        self.cpu_spec_list = cpu_spec_list or ""
+        self.gpus = tuple(
+            gpu if isinstance(gpu, GpuRecord) else GpuRecord.from_dict(gpu)
+            for gpu in gpus or ()
+        )
+
+        unknown = counts.keys() - set(self.COUNT_FIELDS)
+        if unknown:
+            raise InventoryError(f"Unknown node fields: {sorted(unknown)}")
+        for field in self.COUNT_FIELDS:
+            setattr(self, field, _to_count(counts.get(field), field))
+
+    @classmethod
+    def from_dict(cls, node):
+        """Return the record of a node dict read off a relation.
+
+        Fields the schema does not know, sent by newer charms, are dropped.
+        """
+        known = {
+            field: value for field, value in node.items()
+            if field in cls.__slots__
+        }
+        if len(known) != len(node):
+            logger.debug(f"{node.get('node_name')}: dropped unknown fields "
+                         f"{sorted(node.keys() - known.keys())}")
+        try:
+            return cls(**known)
+        except TypeError as e:
+            raise InventoryError(f"Invalid node: {e}")
+
+    def to_dict(self):
+        """Return the node as a dict for relation data."""
+        node = dict()
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value or field not in self.OPTIONAL_FIELDS:
+                node[field] = value
+        if self.gpus:
+            node['gpus'] = [gpu.to_dict() for gpu in self.gpus]
+        return node
+
+    def replace(self, **fields):
+        """Return a copy of the record with fields replaced."""
+        record = object.__new__(NodeRecord)
+        for field in self.__slots__:
+            setattr(record, field, fields.get(field, getattr(self, field)))
+        return record
+
+    def hardware_key(self):
+        """Return the fields that nodes with identical hardware share."""
+        return tuple(
+            getattr(self, field) for field in self.__slots__
+            if field not in ('node_name', 'node_addr')
+        )
+
+    def __eq__(self, other):
+        """Return True if other is a record with the same fields."""
+        if not isinstance(other, NodeRecord):
+            return NotImplemented
+        return all(
+            getattr(self, field) == getattr(other, field)
+            for field in self.__slots__
+        )
+
+    def __hash__(self):
+        """Return the hash of the fields, equal records hash equal."""
+        return hash(tuple(getattr(self, field) for field in self.__slots__))
+
+    def __repr__(self):
+        """Return the record as NodeRecord(node_name=..., ...)."""
+        fields = ", ".join(
+            f"{field}={value!r}" for field, value in self.to_dict().items()
+        )
+        return f"NodeRecord({fields})"
+
+
+class PartitionRecord:
+    """A partition and the records of its nodes."""
+
+    __slots__ = (
+        'partition_name',
+        'partition_state',
+        'partition_config',
+        'partition_default',
+        'inventory',
+    )
+
+    def __init__(self, partition_name, inventory, partition_state=None,
+                 partition_config=None, partition_default=None):
+        """Validate and set the fields, inventory is a list of NodeRecord."""
+        if not partition_name or not isinstance(partition_name, str):
+            raise InventoryError(
+                f"Invalid partition_name: {partition_name!r}"
+            )
+        self.partition_name = partition_name
+        self.partition_state = partition_state
+        self.partition_config = partition_config
+        self.partition_default = partition_default
+        self.inventory = inventory
+
+    @classmethod
+    def from_dict(cls, partition):
+        """Return the record of a partition dict read off a relation."""
+        try:
+            inventory = partition['inventory'] or []
+            return cls(
+                partition['partition_name'],
+                [NodeRecord.from_dict(node) for node in inventory],
+                partition.get('partition_state'),
+                partition.get('partition_config'),
+                partition.get('partition_default'),
+            )
+        except (KeyError, TypeError, AttributeError) as e:
+            raise InventoryError(f"Invalid partition: {e!r}")
+
+    def to_dict(self):
+        """Return the partition as a dict for relation data."""
+        partition = {
+            'inventory': [node.to_dict() for node in self.inventory],
+            'partition_name': self.partition_name,
+            'partition_state': self.partition_state,
+            'partition_config': self.partition_config,
+        }
+        if self.partition_default:
+            partition['partition_default'] = self.partition_default
+        return partition
+
+    def replace(self, **fields):
+        """Return a copy of the record with fields replaced."""
+        record = object.__new__(PartitionRecord)
+        for field in self.__slots__:
+            setattr(record, field, fields.get(field, getattr(self, field)))
+        return record
@@ -0,0 +1,238 @@
+#!/usr/bin/python3
+"""Render each partition to its own slurm.conf include file.
+
+The node and partition definitions make up most of a large slurm.conf.
+Rendering each partition to a file of its own, pulled in with Include
+lines, means only the file of a partition that changed is rewritten, and
+comparing a partition file with what is on disk is cheap.
+
+The gpus of the nodes go to gres.conf, typed and bound to their cores.
+"""
+import logging
+import os
+from pathlib import Path
+
+import hostlist
+
+
+logger = logging.getLogger()
+
+
+SLURM_CONF_DIR = Path("/var/snap/slurm/common/etc/slurm")
+# The include files live next to slurm.conf, which is where slurmctld looks
+# for them when it serves the config to configless slurmd.
+PARTITION_FILE_PREFIX = "slurm-partition-"
+GRES_CONF = "gres.conf"
+GRES_CONF_HEADER = "# Generated from the node inventories by the charms.\n"
+
+# inventory key: slurm.conf node parameter
+NODE_PARAMETERS = (
+    ('node_name', "NodeName"),
+    ('node_addr', "NodeAddr"),
+    ('state', "State"),
+    ('real_memory', "RealMemory"),
+    ('cpus', "CPUs"),
+    ('sockets_per_board', "SocketsPerBoard"),
+    ('cores_per_socket', "CoresPerSocket"),
+    ('threads_per_core', "ThreadsPerCore"),
+    ('weight', "Weight"),
+    ('core_spec_count', "CoreSpecCount"),
+    ('cpu_spec_list', "CpuSpecList"),
+    ('mem_spec_limit', "MemSpecLimit"),
+)
+
+
+def render_node(node):
+    """Return the NodeName line of node."""
+    parameters = [
+        f"{parameter}={node[key]}"
+        for key, parameter in NODE_PARAMETERS if node.get(key)
+    ]
+    gres = render_node_gres(node)
+    if gres:
+        parameters.append(f"Gres={gres}")
+    return " ".join(parameters)
+
+
+def render_node_gres(node):
+    """Return the Gres of node, gpu:<type>:N for each type of its gpus.
+
+    Nodes sent by older charms only carry the number of gpus, gpu:N.
+    """
+    gpus = node.get('gpus')
+    if not gpus:
+        return f"gpu:{node['gres']}" if node.get('gres') else ""
+
+    counts = dict()
+    for gpu in gpus:
+        gres_type = gpu.get('gres_type')
+        counts[gres_type] = counts.get(gres_type, 0) + 1
+    return ",".join(
+        f"gpu:{gres_type}:{count}" if gres_type else f"gpu:{count}"
+        for gres_type, count in counts.items()
+    )
+
+
+def render_gres(node):
+    """Return the gres.conf lines of the gpus of node.
+
+    Cores binds each gpu to the cores local to it, so that jobs get cores
+    on the socket the gpu is attached to.
+    """
+    lines = []
+    for gpu in node.get('gpus') or []:
+        parameters = [f"NodeName={node['node_name']}", "Name=gpu"]
+        if gpu.get('gres_type'):
+            parameters.append(f"Type={gpu['gres_type']}")
+        parameters.append(f"File={gpu['file']}")
+        if gpu.get('cores'):
+            parameters.append(f"Cores={gpu['cores']}")
+        lines.append(" ".join(parameters))
+    return lines
+
+
+def _gres_layout(node):
+    """Return what nodes with gpus in the same gres.conf lines share."""
+    return tuple(
+        (gpu.get('gres_type'), gpu['file'], gpu.get('cores'))
+        for gpu in node.get('gpus') or []
+    )
+
+
+def group_gres_nodes(partitions):
+    """Return the nodes with gpus, one per gpu layout.
+
+    Nodes whose gpus have the same types, device files and cores are folded
+    into one node whose node_name is a hostlist expression, so that a
+    homogeneous cluster gets one set of gres.conf lines.
+    """
+    layouts = dict()
+    for partition in partitions:
+        for node in partition['inventory']:
+            if node.get('gpus'):
+                node_names, _ = layouts.setdefault(
+                    _gres_layout(node),
+                    ([], node),
+                )
+                node_names.extend(hostlist.expand(node['node_name']))
+    return [
+        {**node, 'node_name': hostlist.compress(node_names)}
+        for node_names, node in layouts.values()
+    ]
+
+
+def render_partition(partition):
+    """Return the NodeName and PartitionName lines of partition."""
+    nodes = partition['inventory']
+    lines = [render_node(node) for node in nodes]
+
+    parameters = [
+        f"PartitionName={partition['partition_name']}",
+        f"Nodes={','.join(node['node_name'] for node in nodes)}",
+    ]
+    if partition.get('partition_default') == 'YES':
+        parameters.append("Default=YES")
+    if partition.get('partition_state'):
+        parameters.append(f"State={partition['partition_state']}")
+    if partition.get('partition_config'):
+        parameters.append(partition['partition_config'])
+    lines.append(" ".join(parameters))
+
+    return "\n".join(lines) + "\n"
+
+
+def _write_file(path, content):
+    """Write content to path, durably and atomically."""
+    path_tmp = path.with_suffix(".tmp")
+    with open(path_tmp, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    path_tmp.rename(path)
+
+
+def write_partition_files(partitions, conf_dir=None):
+    """Write the include file of each partition that changed.
+
+    The files are written to conf_dir, SLURM_CONF_DIR by default. Include
+    files of partitions that are gone are removed. Returns the paths of the
+    include files and the names of the ones that changed.
+    """
+    conf_dir = conf_dir or SLURM_CONF_DIR
+    paths = []
+    changed = []
+    for partition in partitions:
+        path = conf_dir / \
+            f"{PARTITION_FILE_PREFIX}{partition['partition_name']}.conf"
+        content = render_partition(partition)
+        try:
+            unchanged = path.read_text() == content
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            _write_file(path, content)
+            changed.append(path.name)
+        paths.append(path)
+
+    for path in conf_dir.glob(f"{PARTITION_FILE_PREFIX}*.conf"):
+        if path not in paths:
+            path.unlink()
+            changed.append(path.name)
+
+    # The renames and removals are only durable once the dir is synced.
+    if changed:
+        conf_dir_fd = os.open(conf_dir, os.O_RDONLY)
+        try:
+            os.fsync(conf_dir_fd)
+        finally:
+            os.close(conf_dir_fd)
+    logger.debug(f"partition files changed: {changed}")
+    return paths, changed
+
+
+def write_gres_conf(partitions, conf_dir=None):
+    """Write the gres.conf of the gpus of all nodes, if it changed.
+
+    slurmd only reads the lines of its own NodeName, slurmctld serves the
+    whole file to configless slurmd. A gres.conf written here is removed
+    again once there are no gpus left. Returns True if there are gpus.
+    """
+    path = (conf_dir or SLURM_CONF_DIR) / GRES_CONF
+    lines = [
+        line
+        for node in group_gres_nodes(partitions)
+        for line in render_gres(node)
+    ]
+    try:
+        current = path.read_text()
+    except OSError:
+        current = None
+
+    if not lines:
+        if current and current.startswith(GRES_CONF_HEADER):
+            path.unlink()
+        return False
+
+    content = GRES_CONF_HEADER + "\n".join(lines) + "\n"
+    if current != content:
+        _write_file(path, content)
+        logger.debug(f"{GRES_CONF} changed: {len(lines)} lines")
+    return True
+
+
+def include_partition_files(slurm_config, conf_dir=None):
+    """Return slurm_config with its partitions moved to include files."""
+    partitions = slurm_config.get('partitions', [])
+    paths, _ = write_partition_files(partitions, conf_dir)
+    lines = [f"Include {path}" for path in paths]
+    if write_gres_conf(partitions, conf_dir):
+        lines.insert(0, "GresTypes=gpu")
+
+    custom_config = slurm_config.get('custom_config', "")
+    return {
+        **slurm_config,
+        'partitions': [],
+        'custom_config': "\n".join(
+            config for config in (custom_config, *lines) if config
+        ),
+    }
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+"""Hardware probing straight from /proc and /sys.
+
+Every function takes the root of the filesystem to read from, so the probes
+can be pointed at a fixture tree instead of the running system.
+"""
+import os
+from pathlib import Path
+
+
+NVIDIA_VENDOR_ID = "0x10de"
+DISPLAY_CONTROLLER_CLASS = "0x03"
+
+
+class ProbeError(Exception):
+    """Raised when the hardware can not be probed."""
+
+
+def _read(root, path):
+    """Return the stripped contents of path below root."""
+    return (Path(root) / path.lstrip("/")).read_text().strip()
+
+
+def parse_cpu_list(cpu_list):
+    """Return the cpu ids in a sysfs cpu list such as '0-3,8-11'."""
+    cpus = []
+    for item in cpu_list.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        start, _, end = item.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def format_cpu_list(cpus):
+    """Return the sysfs style cpu list of cpus, e.g. '0-3,8-11'."""
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(
+        f"{start}-{end}" if start != end else f"{start}"
+        for start, end in ranges
+    )
+
+
+def _cpu_topology_from_sys(root):
+    """Return [(cpu, package_id, core_id)] for the online cpus from sysfs."""
+    cpus = parse_cpu_list(_read(root, "/sys/devices/system/cpu/online"))
+    return [
+        (
+            cpu,
+            int(_read(root, f"/sys/devices/system/cpu/cpu{cpu}/topology/"
+                            "physical_package_id")),
+            int(_read(root, f"/sys/devices/system/cpu/cpu{cpu}/topology/"
+                            "core_id")),
+        )
+        for cpu in cpus
+    ]
+
+
+def _cpu_topology_from_proc(root):
+    """Return [(cpu, package_id, core_id)] for the cpus in /proc/cpuinfo."""
+    topology = []
+    processor = dict()
+    for line in _read(root, "/proc/cpuinfo").splitlines() + [""]:
+        if not line.strip():
+            if 'processor' in processor:
+                topology.append((
+                    int(processor['processor']),
+                    int(processor.get('physical id', 0)),
+                    int(processor.get('core id', processor['processor'])),
+                ))
+            processor = dict()
+            continue
+        key, _, value = line.partition(":")
+        processor[key.strip()] = value.strip()
+    return topology
+
+
+def cpu_topology(root="/"):
+    """Return [(cpu, package_id, core_id)] for the online cpus."""
+    try:
+        topology = _cpu_topology_from_sys(root)
+    except (OSError, ValueError):
+        try:
+            topology = _cpu_topology_from_proc(root)
+        except (OSError, ValueError) as e:
+            raise ProbeError(f"Unable to probe the cpu topology: {e}")
+    if not topology:
+        raise ProbeError("No cpus found.")
+    return topology
+
+
+def cpu_info(root="/", topology=None):
+    """Return cpu info needed to generate node inventory."""
+    topology = topology or cpu_topology(root)
+
+    threads = dict()
+    for _, package_id, core_id in topology:
+        threads[(package_id, core_id)] = \
+            threads.get((package_id, core_id), 0) + 1
+    packages = {package_id for package_id, _ in threads.keys()}
+    cores_per_socket = max(
+        len([core for core in threads.keys() if core[0] == package_id])
+        for package_id in packages
+    )
+
+    return {
+        'cpus': len(topology),
+        'threads_per_core': max(threads.values()),
+        'cores_per_socket': cores_per_socket,
+        'sockets_per_board': len(packages),
+    }
+
+
+def real_memory(root="/"):
+    """Return the total memory in MiB, as reported by free -m."""
+    try:
+        meminfo = _read(root, "/proc/meminfo")
+    except OSError as e:
+        raise ProbeError(f"Unable to probe the memory: {e}")
+
+    for line in meminfo.splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) // 1024
+    raise ProbeError("MemTotal not found in /proc/meminfo.")
+
+
+def _slurm_core_ids(topology):
+    """Return a cpu: slurm core id mapping for the cpus in topology.
+
+    Slurm numbers the cores socket by socket, the cores of a socket in the
+    order of their core_id, whatever the numbering of the kernel.
+    """
+    packages = sorted({package_id for _, package_id, _ in topology})
+    cores = {
+        package_id: sorted({
+            core_id for _, package, core_id in topology
+            if package == package_id
+        })
+        for package_id in packages
+    }
+    cores_per_socket = max(len(core_ids) for core_ids in cores.values())
+    return {
+        cpu: packages.index(package_id) * cores_per_socket +
+        cores[package_id].index(core_id)
+        for cpu, package_id, core_id in topology
+    }
+
+
+def _gpu_model(root, pci_address, device):
+    """Return the model of the gpu and its /dev file index, if known.
+
+    The nvidia driver lists the model and the minor number of every gpu in
+    /proc, without it the model falls back to the pci device id.
+    """
+    try:
+        information = _read(
+            root, f"/proc/driver/nvidia/gpus/{pci_address}/information"
+        )
+    except OSError:
+        try:
+            return (device / "device").read_text().strip(), None
+        except OSError as e:
+            raise ProbeError(f"Unable to probe the gpu {pci_address}: {e}")
+
+    fields = dict(
+        (key.strip(), value.strip())
+        for key, _, value in (
+            line.partition(":") for line in information.splitlines()
+        )
+    )
+    minor = fields.get('Device Minor')
+    return fields.get('Model', ""), int(minor) if minor else None
+
+
+def gpu_type(model):
+    """Return the gres Type of a gpu model.
+
+    'NVIDIA A100-SXM4-40GB' becomes 'a100-sxm4-40gb'.
+    """
+    words = [
+        word for word in model.lower().split()
+        if word not in ('nvidia', 'tesla')
+    ]
+    return "".join(
+        char for char in "_".join(words)
+        if char.isalnum() or char in "_-."
+    )
+
+
+def _gpu_cores(device, core_ids):
+    """Return the slurm core ids local to the gpu, as a cpu list."""
+    try:
+        cpus = parse_cpu_list((device / "local_cpulist").read_text())
+    except (OSError, ValueError):
+        return ""
+    return format_cpu_list(core_ids[cpu] for cpu in cpus if cpu in core_ids)
+
+
+def _read_gpu(root, device, index, core_ids):
+    """Return the record of the gpu at the pci device dir."""
+    model, minor = _gpu_model(root, device.name, device)
+    try:
+        numa_node = int((device / "numa_node").read_text())
+    except (OSError, ValueError):
+        numa_node = -1
+    return {
+        'pci_address': device.name,
+        'file': f"/dev/nvidia{index if minor is None else minor}",
+        'model': model,
+        'gres_type': gpu_type(model),
+        'numa_node': numa_node,
+        'cores': _gpu_cores(device, core_ids),
+    }
+
+
+def _nvidia_pci_devices(root):
+    """Return the pci device dirs of the nvidia gpus, in pci order."""
+    pci_devices = Path(root) / "sys/bus/pci/devices"
+    if not pci_devices.is_dir():
+        return []
+
+    devices = []
+    for device in sorted(pci_devices.iterdir()):
+        try:
+            vendor = (device / "vendor").read_text().strip()
+            device_class = (device / "class").read_text().strip()
+        except OSError:
+            continue
+        if vendor == NVIDIA_VENDOR_ID and \
+                device_class.startswith(DISPLAY_CONTROLLER_CLASS):
+            devices.append(device)
+    return devices
+
+
+def nvidia_gpu_devices(root="/", topology=None):
+    """Return a record of each nvidia gpu that has a device file.
+
+    Each record holds the pci address, device file, model, gres type, numa
+    node and the slurm ids of the cores local to the gpu. The gpus are in
+    pci address order, the order the driver numbers them in.
+    """
+    devices = _nvidia_pci_devices(root)
+    if not devices:
+        return []
+
+    try:
+        core_ids = _slurm_core_ids(topology or cpu_topology(root))
+    except ProbeError:
+        core_ids = dict()
+    gpus = [
+        _read_gpu(root, device, index, core_ids)
+        for index, device in enumerate(devices)
+    ]
+
+    # Without the device files the driver is not loaded, the gpus can not
+    # be used yet.
+    for gpu in gpus:
+        if not os.path.exists(Path(root) / gpu['file'].lstrip("/")):
+            return []
+    return gpus
+
+
+def nvidia_gpus(root="/"):
+    """Return the number of nvidia gpus that have a device file."""
+    return len(nvidia_gpu_devices(root))
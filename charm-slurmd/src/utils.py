@@ -1,116 +1,347 @@
 #!/usr/bin/python3
 """utils.py module for slurmd charm."""
+import hashlib
 import json
-import os
+import logging
 import random
 import subprocess
-import sys
+from datetime import datetime
+from pathlib import Path
 
+import hostlist
+import probe
+from inventory import NodeRecord
 
-def lscpu():
-    """Return lscpu as a python dictionary."""
-    def format_key(lscpu_key):
-        key_lower = lscpu_key.lower()
-        replace_hyphen = key_lower.replace("-", "_")
-        replace_lparen = replace_hyphen.replace("(", "")
-        replace_rparen = replace_lparen.replace(")", "")
-        return replace_rparen.replace(" ", "_")
 
-    lscpu_out = subprocess.check_output(['lscpu'])
-    lscpu_lines = lscpu_out.decode().strip().split("\n")
+logger = logging.getLogger()
 
-    return {
-        format_key(line.split(":")[0].strip()): line.split(":")[1].strip()
-        for line in lscpu_lines
-    }
+SCONTROL = "/snap/bin/slurm.scontrol"
+SQUEUE = "/snap/bin/slurm.squeue"
 
+# Node states the set-node-state action accepts, RESUME clears an override.
+NODE_STATES = frozenset({"DOWN", "DRAIN", "FAIL", "FAILING"})
+RESUME = "RESUME"
+# FAILING can be written to slurm.conf, scontrol update refuses it.
+SCONTROL_NODE_STATES = NODE_STATES - {"FAILING"}
 
-def cpu_info():
-    """Return cpu info needed to generate node inventory."""
-    ls_cpu = lscpu()
 
-    return {
-        'cpus': ls_cpu['cpus'],
-        'threads_per_core': ls_cpu['threads_per_core'],
-        'cores_per_socket': ls_cpu['cores_per_socket'],
-        'sockets_per_board': ls_cpu['sockets'],
-    }
+def get_slurmd_info_version(slurmd_info):
+    """Return a canonical hash of the slurmd_info."""
+    canonical = json.dumps(slurmd_info, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
 
 
-def free_m():
-    """Return the real memory."""
-    real_mem = ""
+def get_boot_id(root="/"):
+    """Return the boot_id of the running kernel."""
     try:
-        real_mem = subprocess.check_output(
-            "free -m | grep -oP '\\d+' | head -n 1",
-            shell=True
+        return (
+            Path(root) / "proc/sys/kernel/random/boot_id"
+        ).read_text().strip()
+    except OSError as e:
+        raise probe.ProbeError(f"Unable to read the boot_id: {e}")
+
+
+def get_hardware_inventory(root="/"):
+    """Probe and return the hardware part of the node inventory."""
+    topology = probe.cpu_topology(root)
+    hardware_inventory = {
+        'real_memory': probe.real_memory(root),
+        **probe.cpu_info(root, topology),
+    }
+
+    gpus = probe.nvidia_gpu_devices(root, topology)
+    if gpus:
+        hardware_inventory['gres'] = len(gpus)
+        hardware_inventory['gpus'] = gpus
+    return hardware_inventory
+
+
+def get_cached_hardware_inventory(cache_file, refresh=False, root="/"):
+    """Return the hardware inventory, probing only when the cache is stale.
+
+    The cache is keyed by the boot_id, hardware can only have changed if the
+    node has been rebooted since the cache was written, or if the caller
+    explicitly asks for a refresh.
+    """
+    boot_id = get_boot_id(root)
+
+    if not refresh and cache_file.exists():
+        try:
+            cache = json.loads(cache_file.read_text())
+        except (OSError, ValueError):
+            cache = dict()
+        # A cache written by an older charm, or edited by hand, may lack
+        # the inventory, in which case the hardware is probed again.
+        if cache.get('boot_id') == boot_id and cache.get('inventory'):
+            return cache['inventory']
+
+    hardware_inventory = get_hardware_inventory(root)
+    write_hardware_inventory_cache(cache_file, hardware_inventory, boot_id)
+    return hardware_inventory
+
+
+def write_hardware_inventory_cache(cache_file, hardware_inventory,
+                                   boot_id=None, root="/"):
+    """Cache hardware_inventory for the boot boot_id, the running one.
+
+    The cache is written to a temporary file and renamed in place, so that
+    a hook that dies mid-write never leaves a truncated cache behind.
+    """
+    cache_file_tmp = cache_file.with_suffix(".tmp")
+    cache_file_tmp.write_text(json.dumps({
+        'boot_id': boot_id or get_boot_id(root),
+        'inventory': hardware_inventory,
+    }))
+    cache_file_tmp.rename(cache_file)
+
+
+def get_inventory(node_name, node_addr, cache_file=None, refresh=False,
+                  root="/"):
+    """Assemble and return the NodeRecord of this node.
+
+    Raises probe.ProbeError if the hardware can not be probed.
+    """
+    if cache_file:
+        hardware_inventory = get_cached_hardware_inventory(
+            cache_file,
+            refresh,
+            root,
         )
-    except subprocess.CalledProcessError as e:
-        print(e)
-        sys.exit(-1)
+    else:
+        hardware_inventory = get_hardware_inventory(root)
 
-    return real_mem.decode().strip()
+    return NodeRecord(node_name, node_addr, "UNKNOWN", **hardware_inventory)
 
 
-def lspci_nvidia():
-    """Check for and return the count of nvidia gpus."""
-    gpus = 0
-    try:
-        gpus = int(
-            subprocess.check_output(
-                "lspci | grep -i nvidia | awk '{print $1}' "
-                "| cut -d : -f 1 | sort -u | wc -l",
-                shell=True
-            ).decode().strip()
+def parse_node_states(node_states):
+    """Return a node_name: state mapping from 'n-c[100-499]=DRAIN,n-c7=DOWN'.
+
+    Node names may be hostlist expressions, a state applies to all the node
+    names listed before it, so 'n-c1,n-c2=DOWN' sets both nodes DOWN.
+    Raises ValueError for node names that are not followed by a state.
+    """
+    parsed = dict()
+    node_names = []
+    for item in hostlist.split_expressions(node_states):
+        names, separator, state = item.partition("=")
+        node_names.extend(hostlist.expand(names.strip()))
+        if separator:
+            parsed.update(
+                (node_name, state.strip().upper())
+                for node_name in node_names
+            )
+            node_names = []
+    if node_names:
+        raise ValueError(f"No state given for {','.join(node_names)}")
+    return parsed
+
+
+def parse_legacy_node_states(user_node_state):
+    """Return the node_name: state mapping of a legacy user_node_state.
+
+    Older charms stored the raw set-node-state parameter and only looked at
+    the items with a state. Items without one, or that do not parse, are
+    logged and dropped rather than failing the upgrade.
+    """
+    node_states = dict()
+    for item in hostlist.split_expressions(user_node_state):
+        if "=" not in item:
+            logger.warning(f"Dropped node state without a state: {item}")
+            continue
+        try:
+            node_states.update(parse_node_states(item))
+        except ValueError as e:
+            logger.warning(f"Dropped invalid node state {item}: {e}")
+    return node_states
+
+
+def update_node_states(node_states, updates):
+    """Return node_states with the updates applied.
+
+    Setting a node to RESUME drops its override.
+    """
+    node_states = dict(node_states)
+    for node_name, state in updates.items():
+        if state == RESUME:
+            node_states.pop(node_name, None)
+        else:
+            node_states[node_name] = state
+    return node_states
+
+
+def _group_node_states(node_states):
+    """Return the node_states as a sorted list of (state, node_names)."""
+    node_names = dict()
+    for node_name, state in node_states.items():
+        node_names.setdefault(state, []).append(node_name)
+    return sorted(node_names.items())
+
+
+def format_node_states(node_states):
+    """Return node_states as 'n-c[100-499]=DRAIN', a hostlist per state."""
+    return ",".join(
+        f"{hostlist.compress(node_names)}={state}"
+        for state, node_names in _group_node_states(node_states)
+    )
+
+
+def scontrol_update_node_states(node_states, reason):
+    """Set node_states on slurmctld, one scontrol update per state.
+
+    Returns (applied, error): the node_states slurmctld took, and the error
+    of the update that failed, None if all of them went through. The
+    updates after a failed one are not tried.
+    """
+    applied = dict()
+    for state, node_names in _group_node_states(node_states):
+        command = [
+            SCONTROL,
+            "update",
+            f"nodename={hostlist.compress(node_names)}",
+            f"state={state}",
+        ]
+        # Every state but RESUME needs a reason.
+        if state != RESUME:
+            command.append(f"reason={reason}")
+        try:
+            subprocess.check_call(command)
+        except (OSError, subprocess.CalledProcessError) as e:
+            return applied, e
+        applied.update((node_name, state) for node_name in node_names)
+    return applied, None
+
+
+def apply_node_states(inventory, node_states):
+    """Return the inventory with the node_states applied.
+
+    Nodes are looked up by node_name in the node_states mapping, only the
+    nodes that have a state override are copied.
+    """
+    if not node_states:
+        return inventory
+
+    return [
+        node.replace(state=node_states[node.node_name])
+        if node.node_name in node_states else node
+        for node in inventory
+    ]
+
+
+def _reserved_cores_per_socket(node, reserved_cores):
+    """Return the cores to reserve on each socket of node.
+
+    The reserved cores are spread evenly over the sockets, rounding up,
+    and at least one core of each socket is left for jobs.
+    """
+    sockets = node.sockets_per_board or 1
+    per_socket = -(-reserved_cores // sockets)
+    return max(0, min(per_socket, node.cores_per_socket - 1))
+
+
+def _cpu_spec_list(node, cores_per_socket):
+    """Return the CpuSpecList of the first cores_per_socket of each socket.
+
+    Slurm numbers its abstract cpus socket by socket, core by core, with
+    the threads of a core next to each other.
+    """
+    threads = node.threads_per_core or 1
+    socket_cpus = node.cores_per_socket * threads
+    reserved_cpus = cores_per_socket * threads
+    return ",".join(
+        f"{start}-{start + reserved_cpus - 1}"
+        if reserved_cpus > 1 else f"{start}"
+        for start in range(
+            0,
+            (node.sockets_per_board or 1) * socket_cpus,
+            socket_cpus,
         )
-    except subprocess.CalledProcessError as e:
-        print(e)
-        sys.exit(-1)
-
-    for graphics_processing_unit in range(gpus):
-        gpu_path = "/dev/nvidia" + str(graphics_processing_unit)
-        if not os.path.exists(gpu_path):
-            return 0
-    return gpus
-
-
-def get_inventory(node_name, node_addr):
-    """Assemble and return the node info."""
-    inventory = {
-        'node_name': node_name,
-        'node_addr': node_addr,
-        'state': "UNKNOWN",
-        'real_memory': free_m(),
-        **cpu_info(),
-    }
+    )
+
+
+def reserve_system_resources(inventory, reserved_cores=0, reserved_memory=0,
+                             pin_cores=False):
+    """Return the inventory with cores and memory reserved for the system.
 
-    gpus = lspci_nvidia()
-    if (gpus > 0):
-        inventory['gres'] = gpus
-    return inventory
+    reserved_cores become the CoreSpecCount of each node, or with pin_cores
+    the CpuSpecList of the first cores of each socket, reserved_memory (in
+    MiB) its MemSpecLimit. Slurm takes either CoreSpecCount or CpuSpecList,
+    never both. At least one core per socket and 1 MiB are left for jobs.
+    """
+    if not (reserved_cores or reserved_memory):
+        return inventory
 
+    reserved_inventory = []
+    for node in inventory:
+        cores_per_socket = _reserved_cores_per_socket(node, reserved_cores)
+        if pin_cores and cores_per_socket:
+            specs = {'cpu_spec_list': _cpu_spec_list(node, cores_per_socket)}
+        else:
+            specs = {
+                'core_spec_count':
+                cores_per_socket * (node.sockets_per_board or 1),
+            }
+        specs['mem_spec_limit'] = \
+            max(0, min(reserved_memory, node.real_memory - 1))
+        reserved_inventory.append(node.replace(**specs))
+    return reserved_inventory
 
-def _related_units(relid):
-    """List of related units."""
-    units_cmd_line = ['relation-list', '--format=json', '-r', relid]
-    return json.loads(
-        subprocess.check_output(units_cmd_line).decode('UTF-8')) or []
 
+def node_is_busy(node_name):
+    """Return True if jobs are running on node_name.
+
+    A node that slurmctld does not know about yet is not busy.
+    """
+    try:
+        jobs = subprocess.check_output([
+            SQUEUE,
+            "--noheader",
+            "--format=%i",
+            "--states=running",
+            f"--nodelist={node_name}",
+        ])
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return bool(jobs.strip())
+
+
+def get_slurmd_registration(node_name):
+    """Return (state, slurmd_start_time) of node_name as seen by slurmctld.
+
+    Returns (None, None) if the node can not be looked up.
+    """
+    try:
+        node = subprocess.check_output([
+            SCONTROL,
+            "show",
+            "node",
+            node_name,
+            "--oneliner",
+        ]).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+    fields = dict(
+        field.split("=", 1) for field in node.split() if "=" in field
+    )
+    try:
+        slurmd_start_time = datetime.strptime(
+            fields.get('SlurmdStartTime', ""),
+            "%Y-%m-%dT%H:%M:%S",
+        )
+    except ValueError:
+        slurmd_start_time = None
+    return fields.get('State'), slurmd_start_time
 
-def _relation_ids(reltype):
-    """List of relation_ids."""
-    relid_cmd_line = ['relation-ids', '--format=json', reltype]
-    return json.loads(
-        subprocess.check_output(relid_cmd_line).decode('UTF-8')) or []
 
+def slurmd_registered(node_name, restarted_at):
+    """Return True if the slurmd restarted at restarted_at has registered.
 
-def get_active_units(relation_name):
-    """Return the active_units."""
-    active_units = []
-    for rel_id in _relation_ids(relation_name):
-        for unit in _related_units(rel_id):
-            active_units.append(unit)
-    return active_units
+    slurmctld has to see the node responding with a SlurmdStartTime no older
+    than the restart.
+    """
+    state, slurmd_start_time = get_slurmd_registration(node_name)
+    return bool(state) and "NOT_RESPONDING" not in state and \
+        bool(slurmd_start_time) and slurmd_start_time >= restarted_at
 
 
 def random_string(length=10):
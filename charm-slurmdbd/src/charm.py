@@ -1,5 +1,11 @@
 #!/usr/bin/python3
 """Slurmdbd Operator Charm."""
+from config_render import (
+    get_changed_keys,
+    get_config_hashes,
+    render_config,
+)
+from hook_profiler import HookProfiler
 from interface_mysql import MySQLClient
 from interface_slurmdbd import Slurmdbd
 from interface_slurmdbd_peer import SlurmdbdPeer
@@ -23,6 +29,9 @@ class SlurmdbdCharm(CharmBase):
         """Set the default class attributes."""
         super().__init__(*args)
 
+        self._profiler = HookProfiler(self, "hook-profiler")
+
+        self._stored.set_default(config_hashes=dict())
         self._stored.set_default(munge_key=str())
         self._stored.set_default(db_info=dict())
         self._stored.set_default(slurm_installed=False)
@@ -54,7 +63,7 @@ class SlurmdbdCharm(CharmBase):
             self._on_slurmdbd_unavailable,
         }
         for event, handler in event_handler_bindings.items():
-            self.framework.observe(event, handler)
+            self.framework.observe(event, self._profiler.instrument(handler))
 
     def _on_install(self, event):
         self._slurm_manager.install()
@@ -116,8 +125,15 @@ class SlurmdbdCharm(CharmBase):
             self._slurmdbd.set_slurmdbd_info_on_app_relation_data(
                 slurmdbd_info
             )
-        self._slurm_manager.render_config_and_restart(slurmdbd_config)
-        self.unit.status = ActiveStatus("Slurmdbd Available")
+        # slurmdbd has no reconfigure, any change to its config is a restart.
+        config_hashes = get_config_hashes(slurmdbd_config)
+        action = render_config(
+            self._slurm_manager,
+            slurmdbd_config,
+            get_changed_keys(self._stored.config_hashes, config_hashes),
+        )
+        self._stored.config_hashes = config_hashes
+        self.unit.status = ActiveStatus(f"Slurmdbd Available ({action})")
 
     def get_port(self):
         """Return the port from slurm-ops-manager."""
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+"""Render slurm configs, restarting the daemon only when needed."""
+import hashlib
+import json
+import logging
+import subprocess
+
+
+logger = logging.getLogger()
+
+
+UNCHANGED = "config unchanged"
+RECONFIGURED = "reconfigured"
+RESTARTED = "restarted"
+
+# Inventory keys that can change without redefining the node.
+_NODE_RUNTIME_KEYS = ('state', 'weight')
+
+
+def _hash(value):
+    """Return a canonical hash of value."""
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_config_hashes(config):
+    """Return a hash for each top level key of config.
+
+    The node definitions in the partitions get a hash of their own under
+    'nodes', adding or removing nodes needs a restart while changing the
+    state or weight of a node does not.
+    """
+    config_hashes = {key: _hash(value) for key, value in config.items()}
+    if 'partitions' in config:
+        config_hashes['nodes'] = _hash([
+            {
+                k: v for k, v in node.items()
+                if k not in _NODE_RUNTIME_KEYS
+            }
+            for partition in config['partitions']
+            for node in partition['inventory']
+        ])
+    return config_hashes
+
+
+def get_changed_keys(previous_hashes, config_hashes):
+    """Return the keys whose hash differs between the two."""
+    return {
+        key for key in {*previous_hashes.keys(), *config_hashes.keys()}
+        if previous_hashes.get(key) != config_hashes.get(key)
+    }
+
+
+def render_config(slurm_manager, config, changed_keys,
+                  reconfigurable_keys=frozenset(), reconfigure=None,
+                  render_context=None):
+    """Render config and return which of the three paths was taken.
+
+    Nothing is rendered when no key changed. When only reconfigurable_keys
+    changed the configs are rendered without a restart and reconfigure() is
+    called to make the daemon pick them up. Any other change renders the
+    configs and restarts the daemon.
+
+    render_context(config), if given, returns what is rendered in place of
+    config. It is only called once it is known that something is rendered.
+    """
+    if not changed_keys:
+        return UNCHANGED
+
+    logger.debug(f"slurm config changed: {sorted(changed_keys)}")
+    if render_context:
+        config = render_context(config)
+
+    # Rendering without a restart needs slurm-ops-manager support, fall
+    # back to a restart if this version of it can not do that.
+    render_slurm_configs = getattr(slurm_manager, 'render_slurm_configs', None)
+    if reconfigure and changed_keys <= set(reconfigurable_keys):
+        if render_slurm_configs:
+            render_slurm_configs(config)
+            try:
+                reconfigure()
+                return RECONFIGURED
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.error(f"reconfigure failed, restarting instead: {e}")
+        else:
+            logger.warning("slurm-ops-manager can not render the configs "
+                           "without a restart, restarting instead.")
+
+    slurm_manager.render_config_and_restart(config)
+    return RESTARTED
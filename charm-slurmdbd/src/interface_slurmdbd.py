@@ -1,6 +1,5 @@
 #! /usr/bin/env python3
 """Slurmdbd."""
-import json
 import logging
 
 
@@ -11,6 +10,11 @@ from ops.framework import (
     ObjectEvents,
     StoredState,
 )
+from payload import (
+    advertise_features,
+    encode,
+    supports_envelope,
+)
 
 
 logger = logging.getLogger()
@@ -88,8 +92,11 @@ class Slurmdbd(Object):
         # Iterate over each of the relations setting the relation data.
         for relation in relations:
             if slurmdbd_info != "":
-                relation.data[self.model.app]['slurmdbd_info'] = json.dumps(
-                    slurmdbd_info
+                advertise_features(relation, self.model.app)
+                relation.data[self.model.app]['slurmdbd_info'] = encode(
+                    slurmdbd_info,
+                    supports_envelope(relation),
+                    'slurmdbd_info',
                 )
             else:
                 relation.data[self.model.app]['slurmdbd_info'] = ""
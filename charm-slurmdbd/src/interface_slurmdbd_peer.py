@@ -1,9 +1,7 @@
 #!/usr/bin/python3
 """SlurmdbdPeer."""
-import copy
 import json
 import logging
-import subprocess
 
 from ops.framework import (
     EventBase,
@@ -11,6 +9,7 @@ from ops.framework import (
     Object,
     ObjectEvents,
 )
+from payload import decode, encode
 
 
 logger = logging.getLogger()
@@ -75,8 +74,8 @@ class SlurmdbdPeer(Object):
             app_relation_data = relation.data[self.model.app]
             unit_relation_data = relation.data[self.model.unit]
 
-            slurmdbd_peers = _get_active_peers()
-            slurmdbd_peers_tmp = copy.deepcopy(slurmdbd_peers)
+            slurmdbd_peers = _get_active_peers(relation)
+            slurmdbd_peers_tmp = list(slurmdbd_peers)
 
             active_slurmdbd = app_relation_data.get('active_slurmdbd')
             backup_slurmdbd = app_relation_data.get('backup_slurmdbd')
@@ -159,7 +158,12 @@ class SlurmdbdPeer(Object):
                 ctxt['backup_slurmdbd_hostname'] = ""
                 ctxt['backup_slurmdbd_port'] = ""
 
-            app_relation_data['slurmdbd_info'] = json.dumps(ctxt)
+            # Units of this application can run different charm revisions
+            # mid upgrade, so the peer payload is always plain json.
+            app_relation_data['slurmdbd_info'] = encode(
+                ctxt,
+                name='slurmdbd_info',
+            )
             self.on.slurmdbd_peer_available.emit()
 
     def _on_relation_departed(self, event):
@@ -177,28 +181,14 @@ class SlurmdbdPeer(Object):
             if app:
                 slurmdbd_info = relation.data[app].get('slurmdbd_info')
                 if slurmdbd_info:
-                    return json.loads(slurmdbd_info)
+                    return decode(slurmdbd_info, 'slurmdbd_info')
         return None
 
 
-def _related_units(relid):
-    """List of related units."""
-    units_cmd_line = ['relation-list', '--format=json', '-r', relid]
-    return json.loads(
-        subprocess.check_output(units_cmd_line).decode('UTF-8')) or []
+def _get_active_peers(relation):
+    """Return the names of the active peer units.
 
-
-def _relation_ids(reltype):
-    """List of relation_ids."""
-    relid_cmd_line = ['relation-ids', '--format=json', reltype]
-    return json.loads(
-        subprocess.check_output(relid_cmd_line).decode('UTF-8')) or []
-
-
-def _get_active_peers():
-    """Return the active_units."""
-    active_units = []
-    for rel_id in _relation_ids('slurmdbd-peer'):
-        for unit in _related_units(rel_id):
-            active_units.append(unit)
-    return active_units
+    The units are read from the ops model rather than by forking
+    relation-ids/relation-list, and sorted to give a stable order.
+    """
+    return sorted(unit.name for unit in relation.units)
@@ -2,6 +2,12 @@
 """SlurmLoginCharm."""
 import logging
 
+from config_render import (
+    get_changed_keys,
+    get_config_hashes,
+    render_config,
+)
+from hook_profiler import HookProfiler
 from ops.charm import CharmBase
 from ops.framework import StoredState
 from ops.main import main
@@ -24,9 +30,14 @@ class SlurmLoginCharm(CharmBase):
     def __init__(self, *args):
         """Initialize charm and configure states and events to observe."""
         super().__init__(*args)
+
+        self._profiler = HookProfiler(self, "hook-profiler")
+
         self._stored.set_default(
+            config_hashes=dict(),
             slurm_installed=False,
             config_available=False,
+            slurm_config_version=str(),
         )
         self.slurm_manager = SlurmManager(self, "slurmrestd")
         self._slurmrestd = SlurmrestdRequires(self, 'slurmrestd')
@@ -44,7 +55,7 @@ class SlurmLoginCharm(CharmBase):
             self._on_check_status_and_write_config,
         }
         for event, handler in event_handler_bindings.items():
-            self.framework.observe(event, handler)
+            self.framework.observe(event, self._profiler.instrument(handler))
 
     def _on_install(self, event):
         self.slurm_manager.install()
@@ -71,9 +82,22 @@ class SlurmLoginCharm(CharmBase):
         else:
             logger.debug("##### STATUS CONFIRMED ######")
             config = dict(self._slurmrestd.get_slurm_config())
+            slurm_config_version = self._slurmrestd.get_slurm_config_version()
             logger.debug(config)
-            self.slurm_manager.render_config_and_restart(config)
-            self.unit.status = ActiveStatus("Slurmrestd Available")
+            # slurmrestd has no reconfigure, any change is a restart.
+            config_hashes = get_config_hashes(config)
+            action = render_config(
+                self.slurm_manager,
+                config,
+                get_changed_keys(self._stored.config_hashes, config_hashes),
+            )
+            self._stored.config_hashes = config_hashes
+            self._stored.slurm_config_version = slurm_config_version
+            self.unit.status = ActiveStatus(f"Slurmrestd Available ({action})")
+
+    def get_slurm_config_version(self):
+        """Return the version of the last rendered slurm_config."""
+        return self._stored.slurm_config_version
 
     def set_config_available(self, boolean):
         """Set self._stored.slurmctld_available."""
@@ -1,19 +1,27 @@
 #!/usr/bin/python3
 """SlurmrestdRequiries."""
-import json
 import logging
 
 
+from config_sections import (
+    get_slurm_config_from_app_data,
+    has_slurm_config,
+    SECTIONS_FEATURE,
+)
 from ops.framework import (
     EventBase,
     EventSource,
     Object,
     ObjectEvents,
 )
+from payload import advertise_features, FEATURES
 
 
 logger = logging.getLogger()
 
+# The configurator may send us the slurm_config in sections.
+PAYLOAD_FEATURES = (*FEATURES, SECTIONS_FEATURE)
+
 
 class SlurmrestdAvailableEvent(EventBase):
     """SlurmctldAvailableEvent."""
@@ -42,7 +50,10 @@ class SlurmrestdRequires(Object):
 
         self._relation_name = relation_name
 
-
+        self.framework.observe(
+            charm.on[relation_name].relation_created,
+            self._on_relation_created
+        )
         self.framework.observe(
             charm.on[relation_name].relation_changed,
             self._on_relation_changed
@@ -52,6 +63,15 @@ class SlurmrestdRequires(Object):
             self._on_relation_broken
         )
 
+    def _on_relation_created(self, event):
+        """Let the configurator know which payloads we can read."""
+        if self.framework.model.unit.is_leader():
+            advertise_features(
+                event.relation,
+                self.model.app,
+                PAYLOAD_FEATURES,
+            )
+
     def _on_relation_changed(self, event):
         """Check for the munge_key in the relation data."""
         event_app_data = event.relation.data.get(event.app)
@@ -59,12 +79,19 @@ class SlurmrestdRequires(Object):
             event.defer()
             return
 
-        slurm_config = event_app_data.get('slurm_config')
-        if not slurm_config:
+        if not has_slurm_config(event_app_data):
             event.defer()
             return
 
         self.charm.set_config_available(True)
+
+        # The configurator publishes a version alongside the slurm_config,
+        # if we have already rendered this version there is nothing to do.
+        slurm_config_version = event_app_data.get('slurm_config_version')
+        if slurm_config_version and \
+                slurm_config_version == self.charm.get_slurm_config_version():
+            logger.debug(f"slurm_config {slurm_config_version} unchanged.")
+            return
         self.on.config_available.emit()
 
     def _on_relation_broken(self, event):
@@ -79,11 +106,20 @@ class SlurmrestdRequires(Object):
             if app:
                 app_data = self._relation.data.get(app)
                 if app_data:
-                    slurm_config = app_data.get('slurm_config')
-                    if slurm_config:
-                        return json.loads(slurm_config)
+                    return get_slurm_config_from_app_data(app_data)
         return None
 
+    def get_slurm_config_version(self):
+        """Return slurm_config_version."""
+        relation = self._relation
+        if relation:
+            app = relation.app
+            if app:
+                app_data = self._relation.data.get(app)
+                if app_data:
+                    return app_data.get('slurm_config_version', str())
+        return str()
+
     @property
     def _relation(self):
         return self.framework.model.get_relation(self._relation_name)
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+"""Test publishing the slurm_config in sections."""
+import json
+import sys
+import unittest
+from pathlib import Path
+
+
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[2] / "charm-slurmd" / "src")
+)
+
+import config_sections  # noqa: E402
+from payload import FEATURES, FEATURES_KEY  # noqa: E402
+
+
+SECTIONS = {
+    'core': {'munge_key': "a2V5", 'cluster_name': "cluster"},
+    'accounting': {'slurmdbd_host': "dbd"},
+    'partitions.debug': {'partition_name': "debug", 'inventory': []},
+    'partitions.batch': {'partition_name': "batch", 'inventory': []},
+}
+
+
+class FakeRelation:
+    """Relation between the 'local' app and a 'remote' app."""
+
+    def __init__(self, features=()):
+        """Advertise features for the remote app."""
+        self.app = "remote"
+        self.data = {
+            "local": dict(),
+            "remote": {FEATURES_KEY: ",".join(features)},
+        }
+
+
+def publish(relation, sections):
+    """Publish sections on relation and return the local app data."""
+    section_hashes = config_sections.get_section_hashes(sections)
+    config_sections.set_slurm_config_on_relation(
+        relation,
+        "local",
+        sections,
+        section_hashes,
+        json.dumps(section_hashes, sort_keys=True),
+        dict(),
+    )
+    return relation.data["local"]
+
+
+class TestSectionHashes(unittest.TestCase):
+    """Hash and merge sections."""
+
+    def test_hashes_ignore_key_order(self):
+        """The hash of a section does not depend on how it was built."""
+        reordered = {'core': dict(reversed(SECTIONS['core'].items()))}
+        self.assertEqual(
+            config_sections.get_section_hashes(reordered)['core'],
+            config_sections.get_section_hashes(SECTIONS)['core'],
+        )
+
+    def test_hashes_change_with_the_section(self):
+        """Changing one section only changes its own hash."""
+        changed = {
+            **SECTIONS,
+            'partitions.debug': {'partition_name': "debug", 'inventory': [1]},
+        }
+        before = config_sections.get_section_hashes(SECTIONS)
+        after = config_sections.get_section_hashes(changed)
+        self.assertEqual(
+            {s for s in before if before[s] != after[s]},
+            {'partitions.debug'},
+        )
+
+    def test_merge_sections(self):
+        """The partitions are gathered into the 'partitions' list."""
+        slurm_config = config_sections.merge_sections(SECTIONS)
+        self.assertEqual(slurm_config['cluster_name'], "cluster")
+        self.assertEqual(slurm_config['slurmdbd_host'], "dbd")
+        self.assertEqual(
+            sorted(p['partition_name'] for p in slurm_config['partitions']),
+            ["batch", "debug"],
+        )
+
+
+class TestSetSlurmConfig(unittest.TestCase):
+    """Publish the slurm_config to remote apps old and new."""
+
+    def test_sections_round_trip(self):
+        """An app that reads sections gets one key per section."""
+        relation = FakeRelation((*FEATURES, config_sections.SECTIONS_FEATURE))
+        app_data = publish(relation, SECTIONS)
+        self.assertIn('slurm_config.partitions.debug', app_data)
+        self.assertNotIn('slurm_config', app_data)
+        self.assertEqual(
+            config_sections.get_slurm_config_from_app_data(app_data),
+            config_sections.merge_sections(SECTIONS),
+        )
+
+    def test_only_changed_sections_are_set(self):
+        """Unchanged sections are not written again, removed ones cleared."""
+        relation = FakeRelation((config_sections.SECTIONS_FEATURE,))
+        app_data = publish(relation, SECTIONS)
+        app_data['slurm_config.core'] = "untouched"
+
+        changed = {
+            section: value for section, value in SECTIONS.items()
+            if section != 'partitions.batch'
+        }
+        changed['accounting'] = {'slurmdbd_host': "dbd2"}
+        publish(relation, changed)
+
+        self.assertEqual(app_data['slurm_config.core'], "untouched")
+        self.assertIn("dbd2", app_data['slurm_config.accounting'])
+        self.assertEqual(app_data['slurm_config.partitions.batch'], "")
+
+    def test_older_app_gets_merged_config(self):
+        """An app that does not read sections gets the plain slurm_config."""
+        relation = FakeRelation()
+        app_data = publish(relation, SECTIONS)
+        self.assertNotIn(config_sections.SECTIONS_KEY, app_data)
+        self.assertEqual(
+            json.loads(app_data['slurm_config']),
+            config_sections.merge_sections(SECTIONS),
+        )
+
+    def test_same_version_is_not_written(self):
+        """A relation holding the version already is left untouched."""
+        relation = FakeRelation((config_sections.SECTIONS_FEATURE,))
+        app_data = publish(relation, SECTIONS)
+        app_data['slurm_config.core'] = "untouched"
+        app_data[config_sections.SECTIONS_KEY] = "{}"
+        publish(relation, SECTIONS)
+        self.assertEqual(app_data['slurm_config.core'], "untouched")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+"""Test the gres.conf generated from a fixture sysfs tree."""
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[2] / "charm-slurmd" / "src")
+)
+
+import partition_files  # noqa: E402
+import probe  # noqa: E402
+import utils  # noqa: E402
+from inventory import NodeRecord  # noqa: E402
+
+
+A100 = "NVIDIA A100-SXM4-40GB"
+
+
+def write(root, path, content):
+    """Write content to path below root."""
+    path = Path(root) / path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def make_gpu_tree(root, gpus):
+    """Write the /proc and /sys of a 2 socket, 4 core node to root.
+
+    gpus is a list of gpu models, the gpus are attached one per socket
+    starting at socket 0. A model of None leaves the gpu out of
+    /proc/driver/nvidia, as when the driver does not list it.
+    """
+    write(root, "proc/sys/kernel/random/boot_id", "boot-id\n")
+    write(root, "proc/meminfo", "MemTotal:       16777216 kB\n")
+    write(root, "sys/devices/system/cpu/online", "0-3\n")
+    for cpu in range(4):
+        topology = f"sys/devices/system/cpu/cpu{cpu}/topology"
+        write(root, f"{topology}/physical_package_id", f"{cpu // 2}\n")
+        write(root, f"{topology}/core_id", f"{cpu % 2}\n")
+
+    for index, model in enumerate(gpus):
+        pci_address = f"0000:{index + 0x10:02x}:00.0"
+        device = f"sys/bus/pci/devices/{pci_address}"
+        write(root, f"{device}/vendor", "0x10de\n")
+        write(root, f"{device}/class", "0x030200\n")
+        write(root, f"{device}/device", "0x20b0\n")
+        write(root, f"{device}/numa_node", f"{index % 2}\n")
+        write(root, f"{device}/local_cpulist",
+              "0-1\n" if index % 2 == 0 else "2-3\n")
+        if model:
+            write(root, f"proc/driver/nvidia/gpus/{pci_address}/information",
+                  f"Model: \t\t {model}\nDevice Minor: \t {index}\n")
+        write(root, f"dev/nvidia{index}", "")
+
+
+class TestGresConf(unittest.TestCase):
+    """Probe fixture trees and check the gres.conf written for them."""
+
+    def setUp(self):
+        """Create a temporary dir for the trees and the conf dir."""
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = Path(tmp_dir.name)
+        self.conf_dir = self.tmp_dir / "etc"
+        self.conf_dir.mkdir()
+
+    def make_node(self, node_name, gpus):
+        """Return the inventory dict of a node probed from a fixture tree."""
+        root = self.tmp_dir / node_name
+        make_gpu_tree(root, gpus)
+        return utils.get_inventory(node_name, "10.0.0.1", root=root).to_dict()
+
+    def read_gres_conf(self):
+        """Return the lines of the gres.conf below the header."""
+        content = (self.conf_dir / partition_files.GRES_CONF).read_text()
+        self.assertTrue(content.startswith(partition_files.GRES_CONF_HEADER))
+        return content[len(partition_files.GRES_CONF_HEADER):].splitlines()
+
+    def test_gpus_are_probed_with_their_local_cores(self):
+        """Each gpu gets its device file, type and the cores of its socket."""
+        node = self.make_node("gpu1", [A100, A100])
+
+        self.assertEqual(node['gres'], 2)
+        self.assertEqual(
+            [(gpu['file'], gpu['gres_type'], gpu['cores'])
+             for gpu in node['gpus']],
+            [("/dev/nvidia0", "a100-sxm4-40gb", "0-1"),
+             ("/dev/nvidia1", "a100-sxm4-40gb", "2-3")],
+        )
+
+    def test_node_line_has_typed_gres(self):
+        """The NodeName line carries Gres=gpu:<type>:N."""
+        node = self.make_node("gpu1", [A100, A100])
+
+        self.assertIn(
+            "Gres=gpu:a100-sxm4-40gb:2",
+            partition_files.render_node(node).split(),
+        )
+
+    def test_gres_conf_lines(self):
+        """gres.conf lists every gpu with its type, file and cores."""
+        node = self.make_node("gpu1", [A100, A100])
+
+        written = partition_files.write_gres_conf(
+            [{'partition_name': "gpu", 'inventory': [node]}],
+            self.conf_dir,
+        )
+
+        self.assertTrue(written)
+        self.assertEqual(self.read_gres_conf(), [
+            "NodeName=gpu1 Name=gpu Type=a100-sxm4-40gb File=/dev/nvidia0 "
+            "Cores=0-1",
+            "NodeName=gpu1 Name=gpu Type=a100-sxm4-40gb File=/dev/nvidia1 "
+            "Cores=2-3",
+        ])
+
+    def test_identical_gpu_layouts_share_lines(self):
+        """Nodes with the same gpus are folded into a hostlist NodeName."""
+        partitions = [
+            {
+                'partition_name': "a",
+                'inventory': [
+                    self.make_node("gpu1", [A100, A100]),
+                    self.make_node("gpu2", [A100, A100]),
+                    self.make_node("cpu1", []),
+                ],
+            },
+            {
+                'partition_name': "b",
+                'inventory': [
+                    self.make_node("gpu3", [A100, A100]),
+                    self.make_node("gpu4", [None]),
+                ],
+            },
+        ]
+
+        partition_files.write_gres_conf(partitions, self.conf_dir)
+
+        self.assertEqual(self.read_gres_conf(), [
+            "NodeName=gpu[1-3] Name=gpu Type=a100-sxm4-40gb "
+            "File=/dev/nvidia0 Cores=0-1",
+            "NodeName=gpu[1-3] Name=gpu Type=a100-sxm4-40gb "
+            "File=/dev/nvidia1 Cores=2-3",
+            "NodeName=gpu4 Name=gpu Type=0x20b0 File=/dev/nvidia0 Cores=0-1",
+        ])
+
+    def test_gres_conf_is_removed_without_gpus(self):
+        """A gres.conf written by the charms goes once the gpus are gone."""
+        partitions = [
+            {'partition_name': "a", 'inventory': [
+                NodeRecord("gpu1", "10.0.0.1").to_dict(),
+            ]},
+        ]
+        path = self.conf_dir / partition_files.GRES_CONF
+        path.write_text(partition_files.GRES_CONF_HEADER)
+
+        self.assertFalse(
+            partition_files.write_gres_conf(partitions, self.conf_dir)
+        )
+        self.assertFalse(path.exists())
+
+    def test_unreadable_gpu_raises_probe_error(self):
+        """A gpu whose model can not be read fails the probe cleanly."""
+        root = self.tmp_dir / "gpu1"
+        make_gpu_tree(root, [None])
+        (root / "sys/bus/pci/devices/0000:10:00.0/device").unlink()
+
+        with self.assertRaises(probe.ProbeError):
+            utils.get_inventory("gpu1", "10.0.0.1", root=root)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""Test the compression and expansion of hostlist expressions."""
+import sys
+import unittest
+from pathlib import Path
+
+
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[2] / "charm-slurmd" / "src")
+)
+
+import hostlist  # noqa: E402
+
+
+class TestCompress(unittest.TestCase):
+    """Compress lists of hostnames."""
+
+    def test_padded_range(self):
+        """Consecutive zero padded names fold into one range."""
+        hostnames = [f"node{i:03d}" for i in range(1, 513)]
+        self.assertEqual(hostlist.compress(hostnames), "node[001-512]")
+
+    def test_gaps_and_order(self):
+        """Unsorted names with gaps give several sorted ranges."""
+        hostnames = ["node7", "node1", "node3", "node2", "node9", "node10"]
+        self.assertEqual(hostlist.compress(hostnames), "node[1-3,7,9-10]")
+
+    def test_single_and_unnumbered(self):
+        """A lone name is left as it is."""
+        self.assertEqual(hostlist.compress(["node5"]), "node5")
+        self.assertEqual(hostlist.compress(["login"]), "login")
+
+    def test_prefixes_are_kept_apart(self):
+        """Each prefix gets a bracket expression of its own."""
+        self.assertEqual(
+            hostlist.compress(["gpu1", "cpu1", "cpu2", "gpu2"]),
+            "cpu[1-2],gpu[1-2]",
+        )
+
+    def test_wide_unpadded_joins_padded_range(self):
+        """node100 extends node[098-099]."""
+        hostnames = [f"node{i:03d}" for i in range(98, 100)] + ["node100"]
+        self.assertEqual(hostlist.compress(hostnames), "node[098-100]")
+
+    def test_duplicates(self):
+        """Duplicate names are only listed once."""
+        self.assertEqual(hostlist.compress(["n1", "n1", "n2"]), "n[1-2]")
+
+
+class TestExpand(unittest.TestCase):
+    """Expand hostlist expressions."""
+
+    def test_ranges(self):
+        """Ranges and single numbers keep their padding."""
+        self.assertEqual(
+            hostlist.expand("node[001-003,007]"),
+            ["node001", "node002", "node003", "node007"],
+        )
+
+    def test_several_expressions(self):
+        """Comma separated expressions and suffixes expand."""
+        self.assertEqual(
+            hostlist.expand("cpu[1-2],login,gpu[08-09]-ib"),
+            ["cpu1", "cpu2", "login", "gpu08-ib", "gpu09-ib"],
+        )
+
+    def test_split_expressions(self):
+        """Commas inside brackets do not split."""
+        self.assertEqual(
+            hostlist.split_expressions("a[1-2,4]=DOWN, b1=DRAIN,"),
+            ["a[1-2,4]=DOWN", "b1=DRAIN"],
+        )
+
+    def test_round_trip(self):
+        """expand() returns the names compress() was given."""
+        hostnames = [
+            *(f"node{i:03d}" for i in range(1, 100)),
+            "node100", "node250", "login", "gpu1", "gpu3",
+        ]
+        expanded = hostlist.expand(hostlist.compress(hostnames))
+        self.assertEqual(sorted(expanded), sorted(hostnames))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""Test parsing, updating and formatting the node state overrides."""
+import sys
+import unittest
+from pathlib import Path
+
+
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[2] / "charm-slurmd" / "src")
+)
+
+import utils  # noqa: E402
+
+
+class TestParseNodeStates(unittest.TestCase):
+    """Parse the set-node-state parameter."""
+
+    def test_hostlist_expressions(self):
+        """Hostlist expressions expand to one entry per node."""
+        self.assertEqual(
+            utils.parse_node_states("n-c[1-3]=drain, n-c7=DOWN"),
+            {'n-c1': "DRAIN", 'n-c2': "DRAIN", 'n-c3': "DRAIN",
+             'n-c7': "DOWN"},
+        )
+
+    def test_state_applies_to_the_names_before_it(self):
+        """'a,b=DOWN' sets both nodes DOWN."""
+        self.assertEqual(
+            utils.parse_node_states("a,b=DOWN,c=RESUME"),
+            {'a': "DOWN", 'b': "DOWN", 'c': "RESUME"},
+        )
+
+    def test_missing_state(self):
+        """Node names that are not followed by a state are refused."""
+        with self.assertRaises(ValueError):
+            utils.parse_node_states("a=DOWN,b")
+
+
+class TestLegacyNodeStates(unittest.TestCase):
+    """Migrate the user_node_state older charms stored."""
+
+    def test_items_without_a_state_are_dropped(self):
+        """The valid items are kept, the others logged and dropped."""
+        with self.assertLogs(level="WARNING"):
+            node_states = utils.parse_legacy_node_states(
+                "n1=DOWN,n2,n[3-4]=DRAIN"
+            )
+        self.assertEqual(
+            node_states, {'n1': "DOWN", 'n3': "DRAIN", 'n4': "DRAIN"}
+        )
+
+    def test_empty(self):
+        """An empty user_node_state migrates to no overrides."""
+        self.assertEqual(utils.parse_legacy_node_states(""), dict())
+
+
+class TestUpdateNodeStates(unittest.TestCase):
+    """Apply and format node state updates."""
+
+    def test_resume_drops_the_override(self):
+        """RESUME clears a node, other states replace what it had."""
+        node_states = {'n1': "DOWN", 'n2': "DRAIN"}
+        self.assertEqual(
+            utils.update_node_states(
+                node_states, {'n1': utils.RESUME, 'n2': "FAIL", 'n3': "DOWN"}
+            ),
+            {'n2': "FAIL", 'n3': "DOWN"},
+        )
+        self.assertEqual(node_states, {'n1': "DOWN", 'n2': "DRAIN"})
+
+    def test_format_node_states(self):
+        """The nodes of each state are folded into a hostlist."""
+        node_states = utils.parse_node_states("n[001-100]=DRAIN,n200=DOWN")
+        formatted = utils.format_node_states(node_states)
+        self.assertEqual(formatted, "n200=DOWN,n[001-100]=DRAIN")
+        self.assertEqual(utils.parse_node_states(formatted), node_states)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""Test the relation payload encoding and the feature negotiation."""
+import sys
+import unittest
+from pathlib import Path
+
+
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[2] / "charm-slurmd" / "src")
+)
+
+import payload  # noqa: E402
+
+
+class FakeRelation:
+    """Relation between the 'local' app and a 'remote' app."""
+
+    def __init__(self, features=None):
+        """Advertise features for the remote app, if any."""
+        self.app = "remote"
+        self.data = {"local": dict(), "remote": dict()}
+        if features is not None:
+            self.data["remote"][payload.FEATURES_KEY] = ",".join(features)
+
+
+class TestEncoding(unittest.TestCase):
+    """Encode and decode payloads."""
+
+    def test_plain_json(self):
+        """Without the envelope the payload is the json older charms read."""
+        value = {'a': [1, 2], 'b': "c"}
+        encoded = payload.encode(value)
+        self.assertEqual(encoded, '{"a":[1,2],"b":"c"}')
+        self.assertEqual(payload.decode(encoded), value)
+
+    def test_small_envelope_is_not_compressed(self):
+        """A payload below COMPRESS_THRESHOLD is enveloped as json."""
+        encoded = payload.encode({'a': 1}, envelope=True)
+        self.assertEqual(encoded, f'{payload.PAYLOAD_VERSION};json;{{"a":1}}')
+        self.assertEqual(payload.decode(encoded), {'a': 1})
+
+    def test_large_envelope_is_compressed(self):
+        """A large payload is compressed and decodes to the same value."""
+        value = [
+            {'node_name': f"node{i:05d}", 'real_memory': 257000}
+            for i in range(1000)
+        ]
+        encoded = payload.encode(value, envelope=True)
+        self.assertTrue(
+            encoded.startswith(f"{payload.PAYLOAD_VERSION};zlib;")
+        )
+        self.assertLess(len(encoded), len(payload.encode(value)))
+        self.assertEqual(payload.decode(encoded), value)
+
+    def test_unknown_encoding(self):
+        """An encoding from a newer charm is refused, not misread."""
+        with self.assertRaises(ValueError):
+            payload.decode(f"{payload.PAYLOAD_VERSION};zstd;abc")
+
+
+class TestFeatures(unittest.TestCase):
+    """Advertise and look up payload features."""
+
+    def test_advertise_features(self):
+        """The features are written to our app data."""
+        relation = FakeRelation()
+        payload.advertise_features(relation, "local", ("x/1", "y/1"))
+        self.assertEqual(
+            relation.data["local"][payload.FEATURES_KEY], "x/1,y/1"
+        )
+
+    def test_supports_feature(self):
+        """Only the features the remote app lists are supported."""
+        relation = FakeRelation(payload.FEATURES)
+        self.assertTrue(payload.supports_envelope(relation))
+        self.assertFalse(payload.supports_feature(relation, "x/1"))
+
+    def test_older_remote_app(self):
+        """A remote app that advertises nothing gets plain json."""
+        self.assertFalse(payload.supports_envelope(FakeRelation()))
+        relation = FakeRelation()
+        relation.app = None
+        self.assertFalse(payload.supports_envelope(relation))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+"""Test the slurmd charm under Harness.
+
+slurm_ops_manager is replaced by the stand-in the benchmarks use, see
+benchmarks/common.py.
+"""
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "benchmarks"))
+
+from common import load_charm_class  # noqa: E402
+from ops.testing import Harness  # noqa: E402
+
+
+SlurmdCharm = load_charm_class('charm-slurmd', 'SlurmdCharm')
+charm_module = sys.modules[SlurmdCharm.__module__]
+
+
+def make_action_event(**params):
+    """Return a set-node-state action event, which can not be deferred."""
+    event = mock.Mock(params={'reason': "test", **params})
+    event.defer.side_effect = RuntimeError("cannot defer action events")
+    return event
+
+
+class SlurmdCharmTestCase(unittest.TestCase):
+    """Run a leader slurmd unit with two peers."""
+
+    config = {}
+
+    def setUp(self):
+        """Create the peer relation before begin(), so that no hook runs."""
+        self.harness = Harness(SlurmdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_leader(True)
+        self.harness.update_config(self.config)
+        self.peer = self.harness.add_relation('slurmd-peer', 'slurmd')
+        self.harness.add_relation_unit(self.peer, 'slurmd/1')
+        self.harness.add_relation_unit(self.peer, 'slurmd/2')
+        self.harness.begin()
+        self.charm = self.harness.charm
+
+    def unit_data(self, unit_name):
+        """Return the peer relation data of unit_name."""
+        return self.harness.get_relation_data(self.peer, unit_name)
+
+    def restart_grants(self):
+        """Return the units the leader granted a restart slot."""
+        return self.charm._slurmd_peer._get_restart_grants()
+
+
+class TestRestartGrants(SlurmdCharmTestCase):
+    """Hand out restart slots in batches and free them again."""
+
+    config = {'restart-batch-size': 1}
+
+    def test_slots_are_handed_out_in_batches(self):
+        """A unit waits for the slot until the restart before it is done."""
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/1', {'restart_request': "v1"}
+        )
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/2', {'restart_request': "v1"}
+        )
+        self.assertEqual(self.restart_grants(), ['slurmd/1'])
+
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/1', {'restart_done': "v1"}
+        )
+        self.assertEqual(self.restart_grants(), ['slurmd/2'])
+
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/2', {'restart_done': "v1"}
+        )
+        self.assertEqual(self.restart_grants(), [])
+
+    def test_newer_request_keeps_the_slot(self):
+        """A restart requested again before it was done keeps its slot."""
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/1', {'restart_request': "v1"}
+        )
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/2', {'restart_request': "v1"}
+        )
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/1', {'restart_request': "v2"}
+        )
+        self.harness.update_relation_data(
+            self.peer, 'slurmd/1', {'restart_done': "v1"}
+        )
+        self.assertEqual(self.restart_grants(), ['slurmd/1'])
+
+
+class TestRegistration(SlurmdCharmTestCase):
+    """Free the slot of a restarted unit once slurmd has registered."""
+
+    def restart(self, seconds_ago):
+        """Record a restart of the leader seconds_ago that holds a slot."""
+        restarted_at = datetime.now().replace(microsecond=0) - \
+            timedelta(seconds=seconds_ago)
+        self.charm._stored.restarted_at = restarted_at.isoformat()
+        self.charm._stored.slurm_config_version = "v1"
+        self.unit_data('slurmd/0')['restart_request'] = "v1"
+        self.charm._slurmd_peer._update_restart_grants()
+        self.assertEqual(self.restart_grants(), ['slurmd/0'])
+
+    @mock.patch.object(charm_module, 'slurmd_registered', return_value=True)
+    def test_registered(self, slurmd_registered):
+        """The restart is reported done and the slot freed."""
+        self.restart(seconds_ago=10)
+        self.charm._check_registration()
+        self.assertEqual(self.unit_data('slurmd/0')['restart_done'], "v1")
+        self.assertEqual(self.charm._stored.restarted_at, "")
+        self.assertEqual(self.restart_grants(), [])
+
+    @mock.patch.object(charm_module, 'slurmd_registered', return_value=False)
+    def test_not_registered_yet(self, slurmd_registered):
+        """The slot is held while slurmd may still register."""
+        self.restart(seconds_ago=10)
+        self.charm._check_registration()
+        self.assertNotIn('restart_done', self.unit_data('slurmd/0'))
+        self.assertEqual(self.restart_grants(), ['slurmd/0'])
+
+    @mock.patch.object(charm_module, 'slurmd_registered', return_value=False)
+    def test_registration_timeout(self, slurmd_registered):
+        """A slurmd that never registers frees its slot after the timeout."""
+        self.restart(seconds_ago=charm_module.REGISTRATION_TIMEOUT + 1)
+        with self.assertLogs(level="WARNING"):
+            self.charm._check_registration()
+        self.assertEqual(self.unit_data('slurmd/0')['restart_done'], "v1")
+        self.assertEqual(self.restart_grants(), [])
+
+
+class TestSetNodeState(SlurmdCharmTestCase):
+    """Run the set-node-state action and migrate legacy node states."""
+
+    def test_slurmd_relation_not_joined(self):
+        """The action reports the states unpublished instead of deferring."""
+        event = make_action_event(**{'node-state': "n[1-2]=DRAIN"})
+        self.charm._on_set_node_state_action(event)
+        event.fail.assert_not_called()
+        results = event.set_results.call_args[0][0]
+        self.assertEqual(results['node-states'], "n[1-2]=DRAIN")
+        self.assertIn('message', results)
+        self.assertEqual(
+            dict(self.charm._stored.node_states),
+            {'n1': "DRAIN", 'n2': "DRAIN"},
+        )
+
+    @mock.patch.object(charm_module, 'scontrol_update_node_states')
+    def test_scontrol_rejects_failing(self, scontrol_update_node_states):
+        """FAILING is refused before scontrol is run."""
+        self.harness.update_config({'node-state-scontrol': True})
+        event = make_action_event(**{'node-state': "n1=FAILING"})
+        self.charm._on_set_node_state_action(event)
+        event.fail.assert_called_once()
+        scontrol_update_node_states.assert_not_called()
+
+    def test_upgrade_migrates_legacy_node_states(self):
+        """user_node_state is parsed into node_states and then reset."""
+        self.charm._stored.user_node_state = "n1=DOWN,n2,n[3-4]=FAIL"
+        with self.assertLogs(level="WARNING"):
+            self.charm._on_upgrade(None)
+        self.assertEqual(
+            dict(self.charm._stored.node_states),
+            {'n1': "DOWN", 'n3': "FAIL", 'n4': "FAIL"},
+        )
+        self.assertEqual(self.charm._stored.user_node_state, "")
+
+
+if __name__ == "__main__":
+    unittest.main()